@@ -1,6 +1,7 @@
 from filesystem._localfs import (
     path,
     root,
+    DirFDCache,
     )
 
 ## TODO: RFC: is this namespace organization sane?
@@ -9,6 +10,14 @@ from filesystem._base import (
     SimpleComparitionMixin,
     WalkMixin,
     StatWrappersMixin,
+    StatCache,
+    ChecksumCache,
+    ChecksumMixin,
+    find_duplicates,
+    stat_many,
+    CopyMixin,
+    TransferStats,
+    MappedFile,
     InsecurePathError,
     CrossDeviceRenameError,
     raise_on_insecure_file_name
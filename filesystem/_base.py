@@ -1,6 +1,16 @@
+from __future__ import with_statement
 import os
+import sys
 import stat
 import errno
+import time
+import re
+import fnmatch
+import Queue
+import hashlib
+import threading
+import collections
+from multiprocessing.pool import ThreadPool
 
 class InsecurePathError(Exception):
     """
@@ -37,6 +47,185 @@ def raise_on_insecure_file_name(name):
 
 
 
+class StatCache(object):
+    """
+    A cache of stat and lstat results.
+
+    Path objects opt in to stat caching by having their
+    ``stat_cache`` attribute set to an instance of this class.  The
+    easiest is to set it on a subclass, then all path objects derived
+    from it through child, join and parent will share the cache:
+
+        class cached_path(filesystem.path):
+            stat_cache = filesystem.StatCache(ttl=5)
+
+    Results older than ``ttl`` seconds are fetched again; if ``ttl``
+    is None they are kept until invalidated.  Path objects invalidate
+    their own entries when they are modified through the API, but
+    changes done by other means are not noticed.  Errors are never
+    cached.
+
+    ``hits`` and ``misses`` count the lookups.
+    """
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+
+    def lookup(self, key, kind, func):
+        """
+        Return the cached result of kind ``kind`` (i.e. 'stat' or
+        'lstat') for ``key``.  If there is no fresh result,
+        ``func(key)`` is called, and its result is cached and
+        returned.
+        """
+        result = self.get(key, kind)
+        if result is not None:
+            return result
+        self.misses += 1
+        result = func(key)
+        self.store(key, kind, result)
+        return result
+
+    def get(self, key, kind):
+        """
+        Return the cached result of kind ``kind`` for ``key``, or None
+        if there is no fresh one.
+        """
+        entry = self._entries.get((key, kind))
+        if entry is not None:
+            (result, stamp) = entry
+            if self.ttl is None or time.time() - stamp < self.ttl:
+                self.hits += 1
+                return result
+        return None
+
+    def store(self, key, kind, result):
+        """
+        Cache ``result`` as the ``kind`` result for ``key``.
+        """
+        self._entries[(key, kind)] = (result, time.time())
+
+    def discard(self, key, kind):
+        """
+        Forget the result of kind ``kind`` for ``key``.
+        """
+        self._entries.pop((key, kind), None)
+
+    def invalidate(self, key, recursive=False):
+        """
+        Forget the results for ``key``.  If ``recursive`` is true,
+        results for keys below ``key`` (as in, starting with ``key``
+        and a slash) are forgotten as well.
+        """
+        for kind in ('stat', 'lstat', 'listed'):
+            self._entries.pop((key, kind), None)
+        if recursive:
+            prefix = key.rstrip(u'/') + u'/'
+            for k in [k for k in self._entries if k[0].startswith(prefix)]:
+                del self._entries[k]
+
+    def clear(self):
+        """
+        Forget all cached results.
+        """
+        self._entries.clear()
+
+
+def _compile_glob_segment(segment):
+    """
+    Compile one path segment of a glob pattern.  Returns None for
+    '**', the segment itself if it has no wildcards, else a function
+    matching names against it.
+    """
+    if segment == u'**':
+        return None
+    raise_on_insecure_file_name(segment)
+    if not re.search(r'[*?[]', segment):
+        return segment
+    return re.compile(fnmatch.translate(segment)).match
+
+def _ignore(e):
+    pass
+
+def _glob_exists(p):
+    try:
+        return p.exists()
+    except OSError:
+        ## i.e. ENOTDIR when a parent is a file
+        return False
+
+
+class ChecksumCache(object):
+    """
+    A cache of file checksums, by the device, inode, size and
+    modification time of the files, so unchanged files aren't read
+    again.
+
+    Path objects opt in by having their ``checksum_cache`` attribute
+    set to an instance of this class, like for ``StatCache``.  The
+    cache can be kept between runs with ``save`` and ``load``.
+
+    Files modified within the last second aren't cached, as they may
+    change again without changing their modification time.  Neither
+    are files on file systems without modification times.
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _key(self, st, algo):
+        if not st.st_mtime or time.time() - st.st_mtime < 1:
+            return None
+        return (algo, st.st_dev, st.st_ino, st.st_size, st.st_mtime)
+
+    def lookup(self, st, algo, func):
+        """
+        Return the cached checksum for the file with the stat result
+        ``st``.  If there is none, ``func()`` is called, and its
+        result is cached and returned.
+        """
+        key = self._key(st, algo)
+        if key is not None:
+            digest = self._entries.get(key)
+            if digest is not None:
+                self.hits += 1
+                return digest
+        self.misses += 1
+        digest = func()
+        if key is not None:
+            with self._lock:
+                self._entries[key] = digest
+        return digest
+
+    def save(self, p):
+        """
+        Write the cache to the file at the path object ``p``.
+        """
+        with self._lock:
+            entries = self._entries.items()
+        with p.open(u'w') as f:
+            for ((algo, dev, ino, size, mtime), digest) in entries:
+                f.write('%s %d %d %d %r %s\n' % (
+                        algo, dev, ino, size, mtime, digest))
+
+    @classmethod
+    def load(cls, p):
+        """
+        Return a cache read from the file at the path object ``p``,
+        written by ``save``.
+        """
+        cache = cls()
+        with p.open() as f:
+            for line in f:
+                (algo, dev, ino, size, mtime, digest) = line.split()
+                cache._entries[(algo, int(dev), int(ino), int(size),
+                                float(mtime))] = digest
+        return cache
+
 ## TODO: RFC: Is there any presedence for this naming convention?  As
 ## I understand it, "Mixin" means that this class can be mixed into
 ## the parent class list in a class definition to get misc methods
@@ -50,7 +239,26 @@ class StatWrappersMixin(object):
     depends on lstat being implemented - assumes the file system does
     not support symlinks and hence has no symlinks if lstat is not
     implemented)
+
+    File systems where stat is expensive may honor ``stat_cache``,
+    see ``StatCache``.
     """
+    __slots__ = ()
+
+    ## opt-in stat caching, see StatCache
+    stat_cache = None
+
+    def _stat_cache_key(self):
+        return unicode(self)
+
+    def refresh(self):
+        """
+        Forget any cached stat information about this path, so the
+        next stat will hit the file system.
+        """
+        if self.stat_cache is not None:
+            self.stat_cache.invalidate(self._stat_cache_key())
+
     def size(self):
         """
         Return the size of the item represented by this path.
@@ -106,6 +314,100 @@ class StatWrappersMixin(object):
         return (hasattr(self, 'lstat') and 
                 stat.S_ISLNK(self.lstat().st_mode))
 
+    def _stat_via(self):
+        ## the path answering stat for this one, see stat_many
+        return self
+
+    @classmethod
+    def _stat_many(cls, paths, workers, follow_symlinks):
+        ## stat paths of this class for stat_many, one after another;
+        ## file systems where stat is latency bound should override
+        return [_stat_or_error(p, follow_symlinks) for p in paths]
+
+def _stat_or_error(p, follow_symlinks):
+    try:
+        if follow_symlinks or not hasattr(p, 'lstat'):
+            return p.stat()
+        return p.lstat()
+    except OSError, e:
+        return e
+
+def _lstat_or_none(p):
+    ## lstat ``p`` if its file system has symlinks, else stat it; None
+    ## if it's gone (i.e. removed while we're walking the tree)
+    try:
+        if hasattr(p, 'lstat'):
+            return p.lstat()
+        return p.stat()
+    except OSError, e:
+        if e.errno == errno.ENOENT:
+            return None
+        raise
+
+def _bounded_apply(workers, jobs, done):
+    """
+    Call ``func(*args)`` for each ``(key, func, args)`` of the
+    iterable ``jobs`` on a pool of ``workers`` threads, and then
+    ``done(key, result)``, in the order of ``jobs``.  Only a few jobs
+    per thread are queued ahead, so ``jobs`` may be a generator,
+    i.e. walking the tree the jobs are for while they're done.
+    """
+    pool = ThreadPool(workers)
+    try:
+        pending = collections.deque()
+        for (key, func, args) in jobs:
+            pending.append((key, pool.apply_async(func, args)))
+            ## don't let the queue grow without bounds
+            while len(pending) > workers * 4:
+                (key, result) = pending.popleft()
+                done(key, result.get())
+        while pending:
+            (key, result) = pending.popleft()
+            done(key, result.get())
+    finally:
+        pool.terminate()
+
+def stat_many(paths, workers=4, follow_symlinks=True):
+    """
+    Stat all of ``paths``, which may belong to any file systems.
+    Returns a list with, in the order of ``paths``, the stat result
+    for each path or the ``OSError`` stat raised for it - a missing
+    path is not an error, but gives an ``OSError`` with errno
+    ENOENT.
+
+    If ``follow_symlinks`` is false, symlinks are lstat'ed.  Each
+    file system stats its paths the way it does that best, for the
+    local file system that is on a pool of ``workers`` threads.
+    """
+    results = []
+    ## the indexes in results of the paths of each file system
+    batches = {}
+    for p in paths:
+        via = p._stat_via()
+        while via is not p:
+            p = via
+            via = p._stat_via()
+        batch = batches.get(p.__class__)
+        if batch is None:
+            batch = batches[p.__class__] = ([], [])
+        batch[0].append(len(results))
+        batch[1].append(p)
+        results.append(None)
+    for (cls, (indexes, batch)) in batches.iteritems():
+        got = cls._stat_many(batch, workers, follow_symlinks)
+        for (i, st) in zip(indexes, got):
+            results[i] = st
+    return results
+
+
+def _disk_usage_links(links, seen):
+    ## the bytes of the hard linked files not counted yet
+    size = 0
+    for (dev, ino, n) in links:
+        if (dev, ino) not in seen:
+            seen.add((dev, ino))
+            size += n
+    return size
 
 class WalkMixin(object):
     """
@@ -113,8 +415,30 @@ class WalkMixin(object):
     filesystem-specific way to do a walk, and if your file system
     class implements iteration, parent, isdir and islink, it may
     inheritate this class.
+
+    File systems that can tell the type of the directory items
+    cheaper than by calling isdir and islink on each of them (i.e.
+    from the directory listing itself) should override
+    _walk_children.
     """
-    def walk(self, topdown=True):
+    __slots__ = ()
+
+    def _walk_children(self):
+        """
+        Return a list of ``(child, isdir, islink)`` tuples, one for
+        each item in this directory.  ``isdir`` is true for
+        directories and symlinks to directories, ``islink`` is only
+        checked (and only true) for the symlinked directories, since
+        walk never recurses into those.
+        """
+        ret = []
+        for c in self:
+            isdir = c.isdir()
+            islink = isdir and hasattr(c, 'islink') and c.islink()
+            ret.append((c, isdir, islink))
+        return ret
+
+    def walk(self, topdown=True, onerror=None):
         """Directory tree generator.
 
         For each directory in the directory tree rooted at top
@@ -128,29 +452,821 @@ class WalkMixin(object):
         be used to prune the search, or to impose a specific order of
         visiting.
 
-        TODO: os.walk can handle errors through callbacks, not to
-        interrupt the whole walk on errors.  We should probably do the
-        same.
+        If a directory can't be listed, the ``OSError`` is raised,
+        unless an ``onerror`` function is given.  Then it's called
+        with the error, and the walk goes on without that directory.
 
         TODO: we should have a follow_symlinks flag, but then we also
         need loop control.
         """
-        children = list(self)
-        ## TODO: optimize?
-        subdirs = [c for c in children if c.isdir()]
-        nondirs = [c for c in children if not c.isdir()]
-        if topdown:
-            yield (self, subdirs, nondirs)
-        for d in subdirs:
-            if (d.parent() != self or d == self):
-                raise InsecurePathError("walk is only allowed into subdirs")
-            if not (hasattr(d, 'islink') and d.islink()):
-                for w in d.walk(topdown):
+        ## We keep an explicit stack rather than recursing, so the
+        ## cost of yielding doesn't grow with the depth of the tree.
+        ## The stack holds directories still to be listed, and for
+        ## bottom-up walks, tuples waiting for their subdirectories
+        ## to be done.
+        stack = [self]
+        while stack:
+            d = stack.pop()
+            if isinstance(d, tuple):
+                yield d
+                continue
+            try:
+                (subdirs, nondirs, known) = d._walk_split()
+            except OSError, e:
+                if onerror is None:
+                    raise
+                onerror(e)
+                continue
+            if topdown:
+                yield (d, subdirs, nondirs)
+            else:
+                stack.append((d, subdirs, nondirs))
+            todo = list(d._walk_descend(subdirs, known))
+            todo.reverse()
+            stack.extend(todo)
+
+    def parallel_walk(self, workers=4, ordered=True, onerror=None):
+        """
+        Directory tree generator listing directories on a pool of
+        ``workers`` threads.  Yields the same 3-tuples as a topdown
+        walk, and the subdirectories list may be modified the same
+        way to prune the search.
+
+        This pays off on file systems where listing and stat'ing is
+        latency bound (i.e. network file systems): the directories
+        are listed ahead of time, while the caller is still busy with
+        the previous ones.
+
+        If ``ordered`` is true, the tuples are yielded in the same
+        order as walk would yield them.  Otherwise they are yielded
+        as soon as they're ready - a directory is still always
+        yielded before its subdirectories.
+
+        ``onerror`` works as for walk.
+        """
+        pool = ThreadPool(workers)
+        try:
+            if ordered:
+                walker = self._parallel_walk_ordered(
+                    pool, workers * 2, onerror)
+            else:
+                walker = self._parallel_walk_unordered(
+                    pool, workers * 2, onerror)
+            for w in walker:
+                yield w
+        finally:
+            pool.terminate()
+
+    def _parallel_walk_ordered(self, pool, window, onerror):
+        ## stack of [directory, pending listing], the top of the
+        ## stack is the next directory to be yielded.  Only the top
+        ## ``window`` directories are listed ahead.
+        stack = [[self, None]]
+        while stack:
+            for item in stack[-window:]:
+                if item[1] is None:
+                    item[1] = pool.apply_async(item[0]._walk_split)
+            (d, pending) = stack.pop()
+            try:
+                (subdirs, nondirs, known) = pending.get()
+            except OSError, e:
+                if onerror is None:
+                    raise
+                onerror(e)
+                continue
+            yield (d, subdirs, nondirs)
+            todo = [[c, None] for c in d._walk_descend(subdirs, known)]
+            todo.reverse()
+            stack.extend(todo)
+
+    def _parallel_walk_unordered(self, pool, window, onerror):
+        done = Queue.Queue()
+        def job(d):
+            try:
+                done.put((d, d._walk_split(), None))
+            except Exception:
+                done.put((d, None, sys.exc_info()))
+        todo = [self]
+        running = 0
+        while todo or running:
+            while todo and running < window:
+                pool.apply_async(job, (todo.pop(),))
+                running += 1
+            (d, split, error) = done.get()
+            running -= 1
+            if error:
+                if onerror is None or not isinstance(error[1], OSError):
+                    raise error[0], error[1], error[2]
+                onerror(error[1])
+                continue
+            (subdirs, nondirs, known) = split
+            yield (d, subdirs, nondirs)
+            todo.extend(d._walk_descend(subdirs, known))
+
+    def disk_usage(self, recursive=True, cache=None, onerror=None):
+        """
+        Return the number of bytes in the files below this directory,
+        as a dict with the total of each directory (with ``recursive``
+        false, only this one).  The totals of directories include the
+        ones of their subdirectories.  Sizes are apparent sizes
+        (st_size) of everything but directories, symlinks are counted
+        themselves, not followed.
+
+        Each entry is lstat'ed once, and files with more than one
+        hard link are counted only once.
+
+        If ``cache`` is given, it's a dict (that may be kept between
+        runs, i.e. pickled) holding the result of the scan of each
+        directory, by the modification time of the directory.  A
+        rescan only lists and stats the entries of directories that
+        have changed since, all others are stat'ed alone.  Note that
+        a file growing doesn't change the modification time of its
+        directory - only new, removed and renamed entries are
+        noticed.  File systems without modification times don't get
+        cached.
+
+        ``onerror`` works as for walk, the directories that can't be
+        listed are left out of the result.
+        """
+        totals = {}
+        seen = set()
+        ## like walk, an explicit stack of (directory, stat result or
+        ## None), and (directory, subdirs) tuples waiting for their
+        ## subdirectories to be summed up
+        stack = [(self, None)]
+        while stack:
+            (d, st) = stack.pop()
+            if isinstance(st, list):
+                for c in st:
+                    totals[d] += totals.get(c, 0)
+                continue
+            try:
+                (size, subdirs) = d._disk_usage_scan(st, seen, cache)
+            except OSError, e:
+                if onerror is None:
+                    raise
+                onerror(e)
+                continue
+            totals[d] = size
+            if recursive and subdirs:
+                stack.append((d, [c for (c, st) in subdirs]))
+                stack.extend(subdirs)
+        return totals
+
+    def _disk_usage_scan(self, st, seen, cache):
+        """
+        Scan this directory for disk_usage.  Returns the bytes in the
+        non-directories in it, and a list of ``(subdir, stat result
+        or None)``.  ``st`` is the stat result of this directory if
+        known.
+        """
+        key = None
+        if cache is not None:
+            if st is None:
+                st = self.stat()
+            if st.st_mtime:
+                key = unicode(self)
+                cached = cache.get(key)
+                if cached is not None and cached[0] == (st.st_ino,
+                                                        st.st_mtime):
+                    (version, size, links, names) = cached
+                    size += _disk_usage_links(links, seen)
+                    return (size, [(self.child(x), None) for x in names])
+        size = 0
+        ## (st_dev, st_ino, st_size) of the files with hard links
+        links = []
+        subdirs = []
+        for c in self:
+            cst = _lstat_or_none(c)
+            if cst is None:
+                continue
+            if stat.S_ISDIR(cst.st_mode):
+                subdirs.append((c, cst))
+            elif cst.st_nlink > 1:
+                links.append((cst.st_dev, cst.st_ino, cst.st_size))
+            else:
+                size += cst.st_size
+        ## a directory changed within the resolution of its mtime may
+        ## change again without changing the mtime
+        if key is not None and time.time() - st.st_mtime > 1:
+            cache[key] = ((st.st_ino, st.st_mtime), size, links,
+                          [c.name() for (c, cst) in subdirs])
+        size += _disk_usage_links(links, seen)
+        return (size, subdirs)
+
+    def rmtree(self, workers=4, onerror=None):
+        """
+        Remove the directory tree at this path, bottom up.  Symlinks
+        to directories are removed, not followed.  File systems that
+        can remove items in parallel do that on ``workers`` threads,
+        this implementation removes them one after another.
+
+        If an item can't be removed, the ``OSError`` is raised, unless
+        an ``onerror`` function is given.  Then it's called with the
+        error, and the rest of the tree is removed.
+        """
+        ## like walk, an explicit stack of directories to be listed
+        ## and 1-tuples of directories to be removed once their items
+        ## are
+        stack = [self]
+        while stack:
+            d = stack.pop()
+            try:
+                if isinstance(d, tuple):
+                    d[0].rmdir()
+                    continue
+                (subdirs, nondirs, known) = d._walk_split()
+            except OSError, e:
+                if onerror is None:
+                    raise
+                onerror(e)
+                continue
+            descend = list(d._walk_descend(subdirs, known))
+            ## what walk doesn't descend into is symlinks
+            descended = set(id(c) for c in descend)
+            nondirs.extend(c for c in subdirs if id(c) not in descended)
+            for c in nondirs:
+                try:
+                    c.unlink()
+                except OSError, e:
+                    if onerror is None:
+                        raise
+                    onerror(e)
+            stack.append((d,))
+            stack.extend(descend)
+
+    def glob(self, pattern):
+        """
+        Yield the paths below this one matching ``pattern``, a
+        relative path with shell style wildcards ('*', '?' and
+        '[...]') in its segments.  A '**' segment matches this and
+        all directories below it (not following symlinks).
+
+        Only directories that may still lead to a match are listed.
+        Segments without wildcards are looked up directly, without
+        listing the directory.
+        """
+        if pattern.startswith(u'/'):
+            raise InsecurePathError('glob pattern must be relative')
+        matchers = [_compile_glob_segment(x)
+                    for x in pattern.split(u'/') if x]
+        found = [self]
+        i = 0
+        while i < len(matchers):
+            m = matchers[i]
+            last = (i == len(matchers) - 1)
+            if m is None and not last and callable(matchers[i+1]):
+                ## '**/<wildcard>': match the items listed by the walk
+                ## rather than listing each directory again
+                i += 1
+                last = (i == len(matchers) - 1)
+                found = self._glob_walk_match(found, matchers[i], last)
+            else:
+                found = self._glob_step(found, m, last)
+            i += 1
+        if matchers.count(None) > 1:
+            ## '**' twice may reach a directory by different ways
+            found = self._glob_unique(found)
+        return found
+
+    def rglob(self, pattern):
+        """
+        Like glob, but matching ``pattern`` in this and all
+        directories below it.
+        """
+        return self.glob(u'**/' + pattern)
+
+    def _glob_step(self, dirs, m, last):
+        for d in dirs:
+            if m is None:
+                for (w, subdirs, nondirs) in d.walk(onerror=_ignore):
                     yield w
-        if not topdown:
-            yield (self, subdirs, nondirs)
+            elif not callable(m):
+                c = d.child(m)
+                if not last or _glob_exists(c):
+                    yield c
+            else:
+                try:
+                    children = d._walk_children()
+                except OSError:
+                    continue
+                for (c, isdir, islink) in children:
+                    if (last or isdir) and m(c.name()):
+                        yield c
+
+    def _glob_walk_match(self, dirs, m, last):
+        for d in dirs:
+            for (w, subdirs, nondirs) in d.walk(onerror=_ignore):
+                for c in subdirs:
+                    if m(c.name()):
+                        yield c
+                if last:
+                    for c in nondirs:
+                        if m(c.name()):
+                            yield c
+
+    def _glob_unique(self, found):
+        seen = set()
+        for p in found:
+            key = unicode(p)
+            if key not in seen:
+                seen.add(key)
+                yield p
+
+    def _walk_split(self):
+        """
+        List this directory for walk.  Returns ``(subdirs, nondirs,
+        known)``, where ``known`` holds the link status of the
+        subdirectories, see ``_walk_descend``.
+        """
+        subdirs = []
+        nondirs = []
+        ## the caller may put other objects into subdirs, so we
+        ## remember the link status by object identity
+        known = {}
+        for (c, isdir, islink) in self._walk_children():
+            if isdir:
+                subdirs.append(c)
+                known[id(c)] = (c, islink)
+            else:
+                nondirs.append(c)
+        return (subdirs, nondirs, known)
 
-    
+    def _walk_descend(self, subdirs, known):
+        """
+        Yield the directories in ``subdirs`` that walk should recurse
+        into, that is, those not being symlinks.  Raises
+        ``InsecurePathError`` if one of them is not a subdirectory of
+        this directory.
+        """
+        depth = None
+        for d in subdirs:
+            (c, islink) = known.get(id(d), (None, None))
+            if c is not d:
+                ## put there by the caller
+                if depth is None:
+                    depth = self.depth()
+                if d.depth() != depth + 1 or not d.is_relative_to(self):
+                    raise InsecurePathError("walk is only allowed into subdirs")
+                islink = hasattr(d, 'islink') and d.islink()
+            if not islink:
+                yield d
+
+
+def copy_stream(src, dst, bufsize):
+    """
+    Copy everything from the file-like object ``src`` to ``dst``, in
+    chunks of ``bufsize`` bytes.  Returns the number of bytes copied.
+    """
+    total = 0
+    while True:
+        buf = src.read(bufsize)
+        if not buf:
+            return total
+        dst.write(buf)
+        total += len(buf)
+
+
+class MappedFile(object):
+    """
+    A file mapped to memory, as returned by the mmap method of path
+    objects.  It wraps a ``mmap.mmap`` object, or whatever buffer a
+    file system maps a file to (i.e. the bytearray of an in-memory
+    file), giving what they have in common: ``len``, indexing and
+    slicing (returning strings), assignment to indexes and slices of
+    the same length unless mapped read-only, flush and close.  It can
+    be used as a context manager, closing it when leaving the block.
+
+    ``buf`` is the underlying buffer, of which ``length`` bytes from
+    ``offset`` are exposed.  ``flush`` and ``close`` are optional
+    functions called by the methods of the same name.
+    """
+    def __init__(self, buf, offset=0, length=None, readonly=False,
+                 flush=None, close=None):
+        self._buf = buf
+        self._offset = offset
+        if length is None:
+            length = len(buf) - offset
+        self._length = length
+        self.readonly = readonly
+        self._flush = flush
+        self._close = close
+        self.closed = False
+
+    def __len__(self):
+        return self._length
+
+    def _range(self, key):
+        ## returns (start, stop, step) in buf for an index or slice
+        if isinstance(key, slice):
+            (start, stop, step) = key.indices(self._length)
+            if stop < start:
+                stop = start
+        else:
+            if key < 0:
+                key += self._length
+            if not 0 <= key < self._length:
+                raise IndexError('mmap index out of range')
+            (start, stop, step) = (key, key + 1, 1)
+        return (start + self._offset, stop + self._offset, step)
+
+    def __getitem__(self, key):
+        if self.closed:
+            raise ValueError('mmap closed or invalid')
+        (start, stop, step) = self._range(key)
+        if isinstance(self._buf, bytearray):
+            ## copied once, not sliced and then copied to a str
+            ret = str(buffer(self._buf, start, stop - start))
+        else:
+            ret = self._buf[start:stop]
+            if isinstance(ret, memoryview):
+                ret = ret.tobytes()
+            elif not isinstance(ret, str):
+                ret = str(ret)
+        if step != 1:
+            ret = ret[::step]
+        return ret
+
+    def __setitem__(self, key, value):
+        if self.closed:
+            raise ValueError('mmap closed or invalid')
+        if self.readonly:
+            raise TypeError('mmap can\'t modify a readonly memory map.')
+        (start, stop, step) = self._range(key)
+        if step != 1:
+            raise ValueError('mmap slice assignment needs a step of 1')
+        if len(value) != stop - start:
+            raise IndexError('mmap slice assignment is wrong size')
+        self._buf[start:stop] = value
+
+    def flush(self):
+        if self._flush is not None and not self.closed:
+            self._flush()
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        self.closed = True
+        if self._close is not None:
+            self._close()
+        self._buf = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TransferStats(object):
+    """
+    Statistics of a transfer, i.e. a move: ``bytes`` copied and the
+    ``seconds`` it took.
+    """
+    def __init__(self):
+        self.bytes = 0
+        self.seconds = None
+        self._start = time.time()
+
+    def finish(self):
+        self.seconds = time.time() - self._start
+        return self
+
+    def bytes_per_second(self):
+        if not self.seconds:
+            return None
+        return self.bytes / self.seconds
+
+    def __repr__(self):
+        return '%s(bytes=%r, seconds=%r)' % (
+            self.__class__.__name__, self.bytes, self.seconds)
+
+
+def _can_copy_links(src, dest):
+    ## the symlinks below src can be made below dest, see _copy_link
+    return (not hasattr(src, 'lstat') or
+            (hasattr(src, 'readlink') and hasattr(dest, 'symlink') and
+             isinstance(dest, PathnameMixin)))
+
+def _copy_link(src, target):
+    ## make ``target`` a symlink with the content of the symlink
+    ## ``src``; symlink links its path object's path name
+    type(target)(src.readlink()).symlink(target)
+
+class CopyMixin(object):
+    """
+    This class gives the methods copy_to and copytree, implemented
+    with open, mkdir and walk, so they work between any two file
+    systems.  File systems that can copy faster between their own
+    paths should override copy_to.
+    """
+    __slots__ = ()
+
+    ## big enough for the per-call overhead not to matter
+    copy_bufsize = 1024 * 1024
+
+    def copy_to(self, dest):
+        """
+        Copy the content of the file at this path to the path object
+        ``dest``, which may belong to any file system.  ``dest`` is
+        created or truncated.  Returns the number of bytes copied.
+        """
+        with self.open('rb') as src:
+            with dest.open('wb') as dst:
+                return copy_stream(src, dst, self.copy_bufsize)
+
+    def copytree(self, dest, workers=4):
+        """
+        Recursively copy the directory tree at this path to the path
+        object ``dest``, which may belong to any file system.  The
+        files are copied with copy_to on a pool of ``workers``
+        threads.  Returns the number of bytes copied.
+
+        Directories are created as needed, existing ones are fine.
+        Like walk, this doesn't follow symlinks to directories, those
+        are left out.  Symlinks to files are copied as files.
+        """
+        return self._copytree(dest, workers)
+
+    def _copytree(self, dest, workers, skip=(), done=None, links=False):
+        ## Files with their relative path name in ``skip`` are not
+        ## copied, ``done(relpath)`` is called for each file copied.
+        ## With ``links``, symlinks to directories are copied as
+        ## symlinks (see _copy_link), else they're left out.
+        def jobs():
+            ## the walk gives us the directories parents first, so
+            ## we can map each to its copy through the subdirs lists
+            ## (str literals, so the relative path names get the type
+            ## of the names the file system gives us)
+            targets = {id(self): (self, dest, '')}
+            for (d, subdirs, nondirs) in self.walk():
+                (src, target, relpath) = targets.pop(id(d))
+                target.mkdir(may_exist=True)
+                for c in subdirs:
+                    if links and c.islink():
+                        name = relpath + c.name()
+                        if name not in skip:
+                            _copy_link(c, target.child(c.name()))
+                            if done is not None:
+                                done(name)
+                        continue
+                    targets[id(c)] = (c, target.child(c.name()),
+                                      relpath + c.name() + '/')
+                for c in nondirs:
+                    name = relpath + c.name()
+                    if name not in skip:
+                        yield (name, c.copy_to, (target.child(c.name()),))
+        total = [0]
+        def copied(name, n):
+            total[0] += n
+            if done is not None:
+                done(name)
+        _bounded_apply(workers, jobs(), copied)
+        return total[0]
+
+    def move(self, dest, workers=4, manifest=None):
+        """
+        Move the file or directory tree at this path to the path
+        object ``dest``, which may belong to any file system.  This is
+        a rename if possible.  Else everything is copied (the files
+        in parallel, on ``workers`` threads) and the source is
+        removed afterwards.  Returns a ``TransferStats``.
+
+        If ``manifest`` is given, it's a path object (of any file
+        system) used for recording the progress of a copying move.
+        If the move is interrupted, calling move again with the same
+        manifest skips the files that were already copied.  The
+        manifest is removed when the move is done.
+
+        Symlinks to directories are moved as symlinks, with the same
+        content, if ``dest`` belongs to a file system with path names
+        and symlinks.  Else a tree containing them can't be moved,
+        that's checked before anything is copied.  Symlinks to files
+        are copied as files, like by copytree.
+
+        Unlike rename, move doesn't change this path object if the
+        file systems differ.
+        """
+        stats = TransferStats()
+        resuming = manifest is not None and manifest.exists()
+        if not resuming:
+            try:
+                self.rename(dest)
+                return stats.finish()
+            except CrossDeviceRenameError:
+                pass
+        skip = set()
+        if resuming:
+            with manifest.open('r') as f:
+                for line in f:
+                    line = line.rstrip('\n')
+                    skip.add(line)
+                    try:
+                        skip.add(line.decode('utf-8'))
+                    except UnicodeDecodeError:
+                        pass
+            if not self.exists():
+                ## the crash came after the source was removed
+                manifest.unlink()
+                return stats.finish()
+        if self.isdir() and not self.islink():
+            if not _can_copy_links(self, dest):
+                for (d, subdirs, nondirs) in self.walk():
+                    for c in subdirs:
+                        if c.islink():
+                            raise OSError(
+                                errno.EOPNOTSUPP,
+                                "can't move symlinks to directories to %r"
+                                % dest, unicode(c))
+            if manifest is not None:
+                log = manifest.open('a')
+                def done(name):
+                    if isinstance(name, unicode):
+                        name = name.encode('utf-8')
+                    log.write(name + '\n')
+                    log.flush()
+            else:
+                log = None
+                done = None
+            try:
+                stats.bytes = self._copytree(dest, workers, skip, done,
+                                             links=True)
+            finally:
+                if log is not None:
+                    log.close()
+            ## symlinks removed, not followed
+            self.rmtree(workers=workers)
+        else:
+            stats.bytes = self.copy_to(dest)
+            self.unlink()
+        if manifest is not None and manifest.exists():
+            manifest.unlink()
+        return stats.finish()
+
+
+class ChecksumMixin(object):
+    """
+    This class gives the methods checksum and checksum_tree,
+    implemented with open, stat and walk.  File systems that have the
+    content at hand (i.e. in memory) should override _checksum.
+    """
+    __slots__ = ()
+
+    ## opt-in checksum caching, see ChecksumCache
+    checksum_cache = None
+
+    checksum_bufsize = 1024 * 1024
+
+    def checksum(self, algo='sha256'):
+        """
+        Return the hex digest of the content of the file at this path,
+        with the ``hashlib`` algorithm ``algo``.
+        """
+        if self.checksum_cache is None:
+            return self._checksum(algo)
+        return self.checksum_cache.lookup(
+            self.stat(), algo, lambda: self._checksum(algo))
+
+    def _checksum(self, algo):
+        h = hashlib.new(algo)
+        with self.open('rb') as f:
+            while True:
+                buf = f.read(self.checksum_bufsize)
+                if not buf:
+                    return h.hexdigest()
+                h.update(buf)
+
+    def checksum_tree(self, algo='sha256', workers=4):
+        """
+        Return a dict with the checksums of all files below this
+        directory, by their path objects.  The files are hashed on a
+        pool of ``workers`` threads (hashlib lets go of the GIL while
+        hashing).  Like walk, this doesn't follow symlinks to
+        directories; symlinks to files are hashed as files, other
+        non-files are left out.
+        """
+        def job(c):
+            ## the stat tells us both whether it's a file and (for
+            ## the cache) whether it changed
+            try:
+                st = c.stat()
+            except OSError, e:
+                if e.errno == errno.ENOENT:
+                    return None
+                raise
+            if not stat.S_ISREG(st.st_mode):
+                return None
+            if c.checksum_cache is None:
+                return c._checksum(algo)
+            return c.checksum_cache.lookup(
+                st, algo, lambda: c._checksum(algo))
+        result = {}
+        def hashed(c, digest):
+            if digest is not None:
+                result[c] = digest
+        _bounded_apply(workers, ((c, job, (c,))
+                                 for (d, subdirs, nondirs) in self.walk()
+                                 for c in nondirs), hashed)
+        return result
+
+## find_duplicates hashes this much from the head and the tail of
+## the files first
+_PARTIAL_SIZE = 64 * 1024
+
+def find_duplicates(*roots, **kwargs):
+    """
+    Find the files with the same content in the trees at the path
+    objects ``roots``, which may belong to different file systems
+    (having walk, stat and checksum).  Returns a list of groups of
+    duplicates, the biggest files first.  Each group is a list of
+    tuples of paths, one tuple for each copy: the hard links to the
+    same file are already deduplicated, so they make up one copy.
+
+    The keyword arguments are ``algo``, the hashlib algorithm to
+    compare the content with (default 'sha256'), ``workers``, the
+    number of threads to hash files on (default 4), and
+    ``min_size``, the size of the smallest files to look at
+    (default 1, leaving out empty files).
+
+    Each file is stat'ed once (symlinks are not followed, nor
+    reported).  Only files of the same size are compared, first by
+    a hash of their head and tail, and only those still the same
+    are read completely.
+    """
+    algo = kwargs.pop('algo', 'sha256')
+    workers = kwargs.pop('workers', 4)
+    min_size = kwargs.pop('min_size', 1)
+    if kwargs:
+        raise TypeError('unexpected keyword arguments: %s'
+                        % ', '.join(kwargs))
+    ## size -> {(st_dev, st_ino): [path, ...]}; without inode numbers
+    ## the path objects are told apart by identity, so the nodes of
+    ## the in-memory file system reached twice are still one file
+    by_size = {}
+    for root in roots:
+        for (d, subdirs, nondirs) in root.walk():
+            for c in nondirs:
+                st = _lstat_or_none(c)
+                if (st is None or not stat.S_ISREG(st.st_mode) or
+                    st.st_size < min_size):
+                    continue
+                key = (st.st_dev, st.st_ino)
+                if not st.st_ino:
+                    key = id(c)
+                links = by_size.setdefault(st.st_size, {}).setdefault(
+                    key, [])
+                ## the same file reached through overlapping roots
+                if c not in links:
+                    links.append(c)
+    pool = ThreadPool(workers)
+    try:
+        duplicates = []
+        for size in sorted(by_size, reverse=True):
+            copies = by_size[size].values()
+            if len(copies) < 2:
+                continue
+            def partial(links):
+                return _partial_hash(links[0], size, algo)
+            for same in _same_hash(pool, copies, partial):
+                if size > 2 * _PARTIAL_SIZE:
+                    def full(links):
+                        try:
+                            return links[0].checksum(algo)
+                        except (IOError, OSError):
+                            return None
+                    groups = _same_hash(pool, same, full)
+                else:
+                    ## the partial hash was of the whole file
+                    groups = [same]
+                for group in groups:
+                    duplicates.append(sorted(tuple(sorted(x)) for x in group))
+        return duplicates
+    finally:
+        pool.terminate()
+
+def _partial_hash(p, size, algo):
+    h = hashlib.new(algo)
+    try:
+        with p.open('rb') as f:
+            if size <= 2 * _PARTIAL_SIZE:
+                h.update(f.read())
+            else:
+                h.update(f.read(_PARTIAL_SIZE))
+                f.seek(size - _PARTIAL_SIZE)
+                h.update(f.read(_PARTIAL_SIZE))
+    except (IOError, OSError):
+        return None
+    return h.hexdigest()
+
+def _same_hash(pool, copies, func):
+    ## the groups of more than one of ``copies`` with the same
+    ## ``func(copy)``, which is None for files we failed to read
+    by_hash = {}
+    for (copy, h) in zip(copies, pool.map(func, copies)):
+        if h is not None:
+            by_hash.setdefault(h, []).append(copy)
+    return [x for x in by_hash.itervalues() if len(x) > 1]
 
 class PathnameMixin(object):
     """
@@ -240,6 +1356,54 @@ class PathnameMixin(object):
         """Return last segment of path."""
         return os.path.basename(self._pathname)
 
+    def _segments(self):
+        ## (absolute, names from the top down), like the parent
+        ## method sees them: relative paths are below '.'
+        pathname = self._pathname
+        absolute = pathname.startswith('/')
+        names = [x for x in pathname.split('/') if x]
+        if not absolute and names and names[0] == '.':
+            del names[0]
+        return (absolute, names)
+
+    def depth(self):
+        """
+        Return the number of times parent has to be called to get to
+        the top, '/' or '.'.
+        """
+        return len(self._segments()[1])
+
+    def is_relative_to(self, other):
+        """
+        Return whether ``other`` is this path or one of its parents.
+        """
+        if self._incomparable(other):
+            return False
+        (absolute, names) = self._segments()
+        (other_absolute, other_names) = other._segments()
+        return (absolute == other_absolute and
+                names[:len(other_names)] == other_names)
+
+    def common_ancestor(self, other):
+        """
+        Return the deepest path that both this path and ``other`` are
+        relative to, or None if there is none.
+        """
+        if self._incomparable(other):
+            return None
+        (absolute, names) = self._segments()
+        (other_absolute, other_names) = other._segments()
+        if absolute != other_absolute:
+            return None
+        i = 0
+        for (a, b) in zip(names, other_names):
+            if a != b:
+                break
+            i += 1
+        if absolute:
+            return self.__class__(u'/' + u'/'.join(names[:i]))
+        return self.__class__(u'/'.join(names[:i]) or u'.')
+
     def _incomparable(self, other):
         """
         Returns ``NotImplemented`` if the other object is considered
@@ -249,20 +1413,29 @@ class PathnameMixin(object):
             return (self._incomparable(other) or
                     other._pathname == self._pathname)
         """
+        ## the common case, the root is a class attribute
+        if other.__class__ is self.__class__:
+            return False
         ## TODO: trap: we're asserting that root wasn't replaced with
         ## a equivalent but non-identical root object (comparing
         ## other.root != self.root would cause a recursion)
-        if not hasattr(other, 'root') or other.root is not self.root:
+        if getattr(other, 'root', None) is not self.root:
             return NotImplemented
         if not isinstance(other, PathnameMixin):
             return NotImplemented
         return False
 
+    def __hash__(self):
+        ## python keeps the hash of the string, no need to cache it
+        return hash(self._pathname)
+
     def __lt__(self, other):
         return (self._incomparable(other) or
                 (self._pathname < other._pathname))
 
     def __eq__(self, other):
+        if other is self:
+            return True
         return (self._incomparable(other) or
                 (self._pathname == other._pathname))
 
@@ -278,12 +1451,38 @@ class PathnameMixin(object):
     def __ne__(self, other):
         return not self == other
 
+def _names(p):
+    ## the names of p and its parents, from the root down
+    names = []
+    parent = p.parent()
+    while parent is not p:
+        names.append(p.name())
+        p = parent
+        parent = p.parent()
+    names.append(p.name())
+    names.reverse()
+    return names
+
 class SimpleComparitionMixin(object):
     """
     This class implements the equity/comparition-methods using
     self.name() and self.parent().  Not compatible with the
     PathnameMixin class.
+
+    The hash is computed from the one of the parent and cached in
+    ``_hash``.  Implementations where existing paths can get another
+    name or parent have to call ``_paths_moved`` when that happens.
     """
+    __slots__ = ('_hash',)
+
+    ## bumped by _paths_moved, cached hashes of older generations are
+    ## computed again
+    _generation = 0
+
+    @staticmethod
+    def _paths_moved():
+        SimpleComparitionMixin._generation += 1
+
     def _incomparable(self, other):
         """
         Returns ``NotImplemented`` if the other object is considered
@@ -293,33 +1492,110 @@ class SimpleComparitionMixin(object):
             return (self._incomparable(other) or
                     other._pathname == self._pathname)
         """
+        if isinstance(other, SimpleComparitionMixin):
+            return False
         for name in ('root', 'parent', 'name'):
             if not hasattr(other, name):
                 return NotImplemented
         return False
 
+    def __hash__(self):
+        generation = SimpleComparitionMixin._generation
+        ## up to the first path with a valid hash (or the root), and
+        ## then down again caching the hashes on the way
+        paths = []
+        h = None
+        p = self
+        while True:
+            cached = getattr(p, '_hash', None)
+            if cached is not None and cached[0] == generation:
+                h = cached[1]
+                break
+            paths.append(p)
+            parent = p.parent()
+            if parent is p:
+                break
+            p = parent
+        for p in reversed(paths):
+            h = hash((h, p.name()))
+            p._hash = (generation, h)
+        return h
+
     def __lt__(self, other):
         if self._incomparable(other):
             return NotImplemented
-
-        ## root object
-        if self.parent() is self and other.parent() is other:
-            return self.name() < other.name()
-
-        ## compare parents ... and if they are equal, compare name
-        return ((self.parent() < other.parent()) or
-                  (self.name() < other.name()))
+        return _names(self) < _names(other)
 
     def __eq__(self, other):
+        if other is self:
+            return True
         if self._incomparable(other):
             return NotImplemented
+        if (isinstance(other, SimpleComparitionMixin) and
+            hash(self) != hash(other)):
+            return False
+        ## up to the root, or to a parent they have in common
+        (a, b) = (self, other)
+        while a is not b:
+            if a.name() != b.name():
+                return False
+            (a_parent, b_parent) = (a.parent(), b.parent())
+            if a_parent is a or b_parent is b:
+                ## two roots with the same name are equal
+                return a_parent is a and b_parent is b
+            (a, b) = (a_parent, b_parent)
+        return True
 
-        ## root object
-        if self.parent() is self and other.parent() is other:
-            return self.name() == other.name()
+    def __ne__(self, other):
+        return not self == other
 
-        return ((self.parent() == other.parent()) and
-                  (self.name() == other.name()))
+    def depth(self):
+        """
+        Return the number of times parent has to be called to get to
+        the root.
+        """
+        depth = 0
+        p = self
+        parent = p.parent()
+        while parent is not p:
+            depth += 1
+            p = parent
+            parent = p.parent()
+        return depth
+
+    def is_relative_to(self, other):
+        """
+        Return whether ``other`` is this path or one of its parents.
+        """
+        ancestor = self.common_ancestor(other)
+        return ancestor is not None and ancestor.depth() == other.depth()
+
+    def common_ancestor(self, other):
+        """
+        Return the deepest path that both this path and ``other`` are
+        relative to, or None if there is none.
+        """
+        if self._incomparable(other):
+            return None
+        (a, b) = (self, other)
+        (depth, other_depth) = (a.depth(), b.depth())
+        for i in range(depth - other_depth):
+            a = a.parent()
+        for i in range(other_depth - depth):
+            b = b.parent()
+        ## up to the root, remembering where the names last differed;
+        ## equal paths may be distinct objects, but once the objects
+        ## are the same, so is the rest
+        ancestor = a
+        while a is not b:
+            parent = a.parent()
+            if parent is a:
+                ## different roots, different file systems
+                return None
+            if a.name() != b.name():
+                ancestor = parent
+            (a, b) = (parent, b.parent())
+        return ancestor
 
     def __gt__(self, other):
         return not self <= other
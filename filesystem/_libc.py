@@ -0,0 +1,95 @@
+"""
+System calls the os module doesn't give us, called through ctypes.
+
+Currently the directory-relative calls openat, unlinkat and mkdirat.
+``available`` is false if they can't be used on this platform, then
+the callers have to do with the path name based calls in os.
+
+Also the in-kernel copy calls copy_file_range and sendfile, those are
+None if missing.
+"""
+import ctypes
+import ctypes.util
+import os
+import sys
+
+## AT_REMOVEDIR is not the same everywhere
+if sys.platform.startswith('linux'):
+    AT_REMOVEDIR = 0x200
+elif sys.platform.startswith('freebsd'):
+    AT_REMOVEDIR = 0x800
+elif sys.platform == 'darwin':
+    AT_REMOVEDIR = 0x80
+else:
+    AT_REMOVEDIR = None
+
+available = False
+if AT_REMOVEDIR is not None:
+    try:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        for _name in ('openat', 'unlinkat', 'mkdirat'):
+            getattr(_libc, _name)
+        available = True
+    except (OSError, AttributeError):
+        pass
+
+def _encode(name):
+    if isinstance(name, unicode):
+        return name.encode(sys.getfilesystemencoding() or 'utf-8')
+    return name
+
+def _check(ret, name):
+    if ret < 0:
+        e = ctypes.get_errno()
+        raise OSError(e, os.strerror(e), name)
+    return ret
+
+def openat(dirfd, name, flags, mode=0777):
+    """
+    Open ``name`` relative to the directory ``dirfd``, like os.open.
+    """
+    return _check(_libc.openat(dirfd, _encode(name), flags, mode), name)
+
+def unlinkat(dirfd, name, flags=0):
+    """
+    Remove ``name`` relative to the directory ``dirfd``.  With
+    ``flags`` set to ``AT_REMOVEDIR`` it works like os.rmdir, else
+    like os.unlink.
+    """
+    _check(_libc.unlinkat(dirfd, _encode(name), flags), name)
+
+def mkdirat(dirfd, name, mode=0777):
+    """
+    Create the directory ``name`` relative to the directory ``dirfd``.
+    """
+    _check(_libc.mkdirat(dirfd, _encode(name), mode), name)
+
+## Copying between file descriptors inside the kernel.  Both work
+## on the file offsets of the descriptors, so one can take over where
+## the other gave up.
+copy_file_range = None
+sendfile = None
+if available:
+    if hasattr(_libc, 'copy_file_range'):
+        _libc.copy_file_range.restype = ctypes.c_ssize_t
+        _libc.copy_file_range.argtypes = [
+            ctypes.c_int, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p,
+            ctypes.c_size_t, ctypes.c_uint]
+        def copy_file_range(infd, outfd, count):
+            """
+            Copy up to ``count`` bytes from ``infd`` to ``outfd``,
+            returns the number of bytes copied, 0 at end of file.
+            """
+            return _check(
+                _libc.copy_file_range(infd, None, outfd, None, count, 0),
+                None)
+    ## only linux can sendfile to something else than a socket
+    if sys.platform.startswith('linux') and hasattr(_libc, 'sendfile'):
+        _libc.sendfile.restype = ctypes.c_ssize_t
+        _libc.sendfile.argtypes = [
+            ctypes.c_int, ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t]
+        def sendfile(infd, outfd, count):
+            """
+            Like copy_file_range, but works on older kernels.
+            """
+            return _check(_libc.sendfile(outfd, infd, None, count), None)
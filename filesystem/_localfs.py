@@ -1,20 +1,484 @@
+from __future__ import with_statement
 import errno
 import os
 import stat
 import pwd
 import grp
+import threading
+import mmap as _mmap
+import contextlib
+import collections
+from multiprocessing.pool import ThreadPool
+
+## scandir gives us the item types from the directory listing (d_type)
+## for free.  It's in the os module from python 3.5, and available as
+## a separate module for older pythons.
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 from filesystem._base import (
     PathnameMixin,
     WalkMixin,
     StatWrappersMixin,
+    CopyMixin,
+    ChecksumMixin,
+    MappedFile,
     InsecurePathError,
     CrossDeviceRenameError,
+    _stat_or_error,
     )
+from filesystem import _libc
+
+class DirFDCache(object):
+    """
+    A bounded set of open directory file descriptors.
+
+    Path objects having their ``dirfd_cache`` attribute set to an
+    instance of this class (typically on a subclass, like with
+    ``StatCache``) open, create, remove and stat items relative to a
+    descriptor of the parent directory (openat, mkdirat, unlinkat),
+    and list directories through their own descriptor, instead of
+    passing the full path name to the kernel, which then only has to
+    look up the last path segment.  Once a directory is opened,
+    operations below it keep working on that very directory, even if
+    the path name is meanwhile made to point elsewhere (i.e. by
+    replacing a parent directory with a symlink, or by renaming it
+    and creating a new one in its place), until the descriptor is
+    forgotten.  Directories removed behind our back are opened anew
+    by their path name.
+
+    Where there is no /proc/self/fd to reach a descriptor by path
+    name, stat and listing use the full path name.
+
+    At most ``max_fds`` descriptors are kept open, the least recently
+    used are closed first.  Descriptors in use by another thread are
+    never closed, so the limit may be exceeded briefly.  Call close
+    (or use the cache as a context manager) to close them all.
+    """
+    def __init__(self, max_fds=64):
+        self.max_fds = max_fds
+        ## path name -> [fd, users, path name], least recently used
+        ## first
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, pathname):
+        return pathname in self._entries
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @contextlib.contextmanager
+    def acquire(self, pathname):
+        """
+        Context manager giving an open descriptor of the directory
+        ``pathname``.  The descriptor stays valid until the block is
+        left.
+        """
+        entry = self._pin(pathname)
+        try:
+            yield entry[0]
+        finally:
+            self._unpin(entry)
+
+    def _pin(self, pathname):
+        with self._lock:
+            entry = self._entries.pop(pathname, None)
+            if entry is not None:
+                self._entries[pathname] = entry
+                entry[1] += 1
+        if entry is not None:
+            if os.fstat(entry[0]).st_nlink:
+                return entry
+            ## removed behind our back (and maybe created again), the
+            ## path name is opened anew
+            self._drop(entry)
+        with self._lock:
+            (head, tail) = os.path.split(pathname)
+            parent = self._entries.get(head)
+            if parent is not None and tail:
+                parent[1] += 1
+        ## we're not holding the lock while doing i/o
+        flags = os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0)
+        try:
+            fd = None
+            if parent is not None and tail:
+                try:
+                    fd = _libc.openat(parent[0], tail, flags)
+                except OSError, e:
+                    ## the parent may be gone too
+                    if e.errno != errno.ENOENT:
+                        raise
+            if fd is None:
+                fd = os.open(pathname, flags)
+        finally:
+            if parent is not None and tail:
+                self._unpin(parent)
+        with self._lock:
+            entry = self._entries.get(pathname)
+            if entry is not None:
+                ## another thread was faster
+                os.close(fd)
+            else:
+                entry = [fd, 0, pathname]
+                self._entries[pathname] = entry
+            entry[1] += 1
+            self._evict()
+            return entry
+
+    def _drop(self, entry):
+        with self._lock:
+            if self._entries.get(entry[2]) is entry:
+                del self._entries[entry[2]]
+        self._unpin(entry)
+
+    def _unpin(self, entry):
+        with self._lock:
+            entry[1] -= 1
+            if not entry[1] and self._entries.get(entry[2]) is not entry:
+                ## forgotten while in use
+                os.close(entry[0])
+            self._evict()
+
+    def _evict(self):
+        ## must be called with the lock held
+        if len(self._entries) <= self.max_fds:
+            return
+        for entry in self._entries.values():
+            if not entry[1]:
+                del self._entries[entry[2]]
+                os.close(entry[0])
+                if len(self._entries) <= self.max_fds:
+                    return
+
+    def forget(self, pathname, recursive=False):
+        """
+        Close the descriptor of ``pathname``, i.e. because the
+        directory was removed or renamed.  If ``recursive`` is true,
+        also descriptors of directories below it are closed.
+        """
+        prefix = pathname.rstrip(u'/') + u'/'
+        with self._lock:
+            for entry in self._entries.values():
+                if (entry[2] == pathname or
+                    (recursive and entry[2].startswith(prefix))):
+                    del self._entries[entry[2]]
+                    if not entry[1]:
+                        os.close(entry[0])
+
+    def close(self):
+        """
+        Close all descriptors not in use.  Those in use are closed
+        when they're released.
+        """
+        with self._lock:
+            for entry in self._entries.values():
+                if not entry[1]:
+                    os.close(entry[0])
+            self._entries.clear()
+
+def _kernel_copy(infd, outfd, bufsize):
+    """
+    Copy from ``infd`` to ``outfd`` until end of file, without moving
+    the data through python if the os allows.  Returns the number of
+    bytes copied.
+    """
+    total = 0
+    for func in (_libc.copy_file_range, _libc.sendfile):
+        if func is None:
+            continue
+        try:
+            while True:
+                ## sendfile won't do more than 2G at once
+                n = func(infd, outfd, 0x40000000)
+                if not n:
+                    return total
+                total += n
+        except OSError, e:
+            ## not supported for those files (i.e. copy_file_range
+            ## across file systems on older kernels); since we're
+            ## copying at the file offsets, the next way can take
+            ## over from here
+            if e.errno not in (errno.ENOSYS, errno.EXDEV, errno.EINVAL,
+                               errno.EOPNOTSUPP, errno.EPERM):
+                raise
+    while True:
+        buf = os.read(infd, bufsize)
+        if not buf:
+            return total
+        while buf:
+            n = os.write(outfd, buf)
+            total += n
+            buf = buf[n:]
+
+## mmap access mode -> (os.open flags, mmap access)
+_mmap_modes = {
+    'r': (os.O_RDONLY, _mmap.ACCESS_READ),
+    'w': (os.O_RDWR, _mmap.ACCESS_WRITE),
+    'c': (os.O_RDONLY, _mmap.ACCESS_COPY),
+    }
+
+def _rmdirat(dirfd, name):
+    _libc.unlinkat(dirfd, name, _libc.AT_REMOVEDIR)
+
+def _open_flags(mode):
+    """
+    Translate a mode string for open into flags for os.open.
+    """
+    if '+' in mode:
+        flags = os.O_RDWR
+    elif 'r' in mode or 'U' in mode:
+        flags = os.O_RDONLY
+    else:
+        flags = os.O_WRONLY
+    if 'w' in mode:
+        flags |= os.O_CREAT | os.O_TRUNC
+    elif 'a' in mode:
+        flags |= os.O_CREAT | os.O_APPEND
+    return flags
+
+## the directory an open descriptor refers to, by a path name that
+## keeps pointing to it whatever is renamed, where the platform has one
+if os.path.isdir('/proc/self/fd'):
+    def _fd_pathname(fd, pathname):
+        return u'/proc/self/fd/%d' % fd
+else:
+    def _fd_pathname(fd, pathname):
+        return pathname
+
+def _list_items(pathname):
+    """
+    Return a list of ``(name, st)`` for the items in the directory
+    ``pathname``, ``st`` being the lstat result for subdirectories
+    and None for the other items (symlinks are not followed).  Where
+    we have scandir, the types are taken from the directory listing
+    and only the subdirectories are lstat'ed, else each item is.
+    """
+    if scandir is not None:
+        items = [(entry.name, entry.is_dir(follow_symlinks=False))
+                 for entry in scandir(pathname)]
+    else:
+        items = [(name, None) for name in os.listdir(pathname)]
+    ret = []
+    for (name, isdir) in items:
+        st = None
+        if isdir is not False:
+            try:
+                st = os.lstat(os.path.join(pathname, name))
+            except OSError, e:
+                ## removed while we're looking
+                if e.errno == errno.ENOENT:
+                    continue
+                raise
+            if not stat.S_ISDIR(st.st_mode):
+                st = None
+        ret.append((name, st))
+    return ret
+
+class _Dir(object):
+    ## a directory being removed by _TreeRemover
+    __slots__ = ('pathname', 'name', 'parent', 'parent_fd', 'st', 'fd',
+                 'pending', 'failed', 'queued')
+
+    def __init__(self, pathname, name, parent, parent_fd, st):
+        self.pathname = pathname
+        self.name = name
+        self.parent = parent
+        ## the descriptor of the parent directory, None if we can't
+        ## work relative to descriptors
+        self.parent_fd = parent_fd
+        ## the lstat result from the listing of the parent
+        self.st = st
+        self.fd = None
+        ## jobs not done below it, including its own
+        self.pending = 1
+        self.failed = False
+        ## removed by a job of its own, rather than by the job of a
+        ## directory above it
+        self.queued = False
+
+class _TreeRemover(object):
+    """
+    Removes a directory tree for path.rmtree, on a pool of
+    ``workers`` threads.  Each directory is listed (and the items in
+    it but subdirectories removed) by a job of its own, which queues
+    a job for each subdirectory.  The last job done below a directory
+    removes it, so sibling subtrees are removed in parallel and no
+    job ever waits for another.
+
+    Where the platform allows, everything is done relative to the
+    descriptors of the directories: each is opened relative to its
+    parent (not following symlinks) and has to be the directory that
+    was listed there, its items are removed relative to it, and it
+    is removed relative to its parent, whose descriptor is kept open
+    until then.  A directory replaced while we're at it (i.e. by a
+    symlink) doesn't make us remove anything outside of the tree.
+
+    As each directory has a descriptor open until everything below
+    it is gone, at most ``max_queued`` directories are queued at a
+    time.  Subdirectories found while that many are queued are
+    removed by the job that found them, depth first, so that job has
+    just one descriptor open for each level below its directory.
+    """
+    _dir_flags = (os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0) |
+                  getattr(os, 'O_NOFOLLOW', 0))
+
+    def __init__(self, workers, max_queued=None):
+        self.workers = workers
+        if max_queued is None:
+            max_queued = workers * 16
+        self.max_queued = max_queued
+        self.errors = []
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._pool = None
+        self._queued = 0
+
+    def run(self, pathname, st):
+        """
+        Remove the tree at ``pathname``, which lstat'ed to ``st``, and
+        return the errors.
+        """
+        top_fd = None
+        self._pool = ThreadPool(self.workers)
+        try:
+            if _libc.available:
+                top_fd = os.open(os.path.dirname(pathname), self._dir_flags)
+            self._queued = 1
+            self._submit(_Dir(pathname, os.path.basename(pathname), None,
+                              top_fd, st))
+            ## an untimed wait can't be interrupted (by KeyboardInterrupt)
+            while not self._done.wait(0.1):
+                pass
+        finally:
+            self._pool.terminate()
+            if top_fd is not None:
+                os.close(top_fd)
+        return self.errors
+
+    def _submit(self, d):
+        d.queued = True
+        self._pool.apply_async(self._remove_items, (d,))
 
-class path(PathnameMixin, WalkMixin, StatWrappersMixin):
+    def _error(self, d, e):
+        with self._lock:
+            self.errors.append(e)
+            d.failed = True
+
+    def _remove_items(self, d):
+        ## the subdirectories not queued, depth first
+        todo = [d]
+        while todo:
+            d = todo.pop()
+            subdirs = self._list(d)
+            if subdirs:
+                with self._lock:
+                    d.pending += len(subdirs)
+                    queue = min(len(subdirs), self.max_queued - self._queued)
+                    queue = max(queue, 0)
+                    self._queued += queue
+                for subdir in subdirs[:queue]:
+                    self._submit(subdir)
+                todo.extend(subdirs[queue:])
+            self._finish(d)
+
+    def _list(self, d):
+        """
+        Open and list the directory of ``d``, and remove the items in
+        it but subdirectories.  Returns the subdirectories.
+        """
+        subdirs = []
+        try:
+            if d.parent_fd is not None:
+                d.fd = _libc.openat(d.parent_fd, d.name, self._dir_flags)
+                st = os.fstat(d.fd)
+                if (st.st_dev, st.st_ino) != (d.st.st_dev, d.st.st_ino):
+                    raise OSError(errno.EAGAIN,
+                                  'directory replaced while removing it',
+                                  d.pathname)
+                listing = _fd_pathname(d.fd, d.pathname)
+            else:
+                listing = d.pathname
+            for (name, st) in _list_items(listing):
+                if st is not None:
+                    subdirs.append(_Dir(os.path.join(d.pathname, name), name,
+                                        d, d.fd, st))
+                    continue
+                try:
+                    if d.fd is not None:
+                        _libc.unlinkat(d.fd, name)
+                    else:
+                        os.unlink(os.path.join(d.pathname, name))
+                except OSError, e:
+                    if e.errno != errno.ENOENT:
+                        self._error(d, e)
+        except Exception, e:
+            self._error(d, e)
+        return subdirs
+
+    def _finish(self, d):
+        ## up the tree for as long as this was the last job below
+        while d is not None:
+            with self._lock:
+                d.pending -= 1
+                if d.pending:
+                    return
+            if d.fd is not None:
+                os.close(d.fd)
+                d.fd = None
+            if d.queued:
+                with self._lock:
+                    self._queued -= 1
+            ## a directory with items we failed to remove can't be
+            ## removed, and nor can its parents
+            if not d.failed:
+                try:
+                    if d.parent_fd is not None:
+                        _rmdirat(d.parent_fd, d.name)
+                    else:
+                        os.rmdir(d.pathname)
+                except OSError, e:
+                    self._error(d, e)
+            parent = d.parent
+            if parent is None:
+                self._done.set()
+            elif d.failed:
+                with self._lock:
+                    parent.failed = True
+            d = parent
+
+class path(PathnameMixin, WalkMixin, StatWrappersMixin, CopyMixin,
+           ChecksumMixin):
     ## RFC: do we need a chroot method?
-    
+
+    ## opt-in directory descriptor reuse, see DirFDCache
+    dirfd_cache = None
+
+    def _at(self, func, pathfunc, *args):
+        """
+        Call ``func(dirfd, name, *args)``, with ``dirfd`` being an
+        open descriptor of the parent directory and ``name`` the last
+        segment of this path, if we have a ``dirfd_cache``.  Else
+        call ``pathfunc(pathname, *args)``.
+        """
+        if self.dirfd_cache is not None and _libc.available:
+            (head, tail) = os.path.split(self._pathname)
+            if tail not in ('', '.', '..'):
+                with self.dirfd_cache.acquire(head or '.') as dirfd:
+                    return func(dirfd, tail, *args)
+        return pathfunc(self._pathname, *args)
+
     def open(self, *args, **kwargs):
         """
         Return a file-like object denoted by this path object.
@@ -23,7 +487,73 @@ class path(PathnameMixin, WalkMixin, StatWrappersMixin):
         constructor. If that raises an exception it will be passed on
         to the caller of the ``open`` method.
         """
-        return open(self._pathname, *args, **kwargs)
+        if self.dirfd_cache is not None and _libc.available:
+            f = self._open_at(*args, **kwargs)
+        else:
+            f = open(self._pathname, *args, **kwargs)
+        if self.stat_cache is not None and f.mode.strip('rbUt'):
+            ## opened for writing, the file may have been created or
+            ## truncated
+            self.refresh()
+        return f
+
+    def _open_at(self, mode='r', buffering=-1):
+        try:
+            fd = self._at(_libc.openat, os.open, _open_flags(mode), 0666)
+        except OSError, e:
+            ## to be consistent with the built-in open
+            raise IOError(e.errno, e.strerror, self._pathname)
+        return os.fdopen(fd, mode, buffering)
+
+    def copy_to(self, dest):
+        """
+        Copy the content of the file at this path to the path object
+        ``dest``, which is created or truncated.  Returns the number
+        of bytes copied.
+
+        If ``dest`` is on the local file system too, the data is
+        copied inside the kernel (copy_file_range or sendfile) where
+        possible.
+        """
+        if not isinstance(dest, path) or dest.root is not self.root:
+            return super(path, self).copy_to(dest)
+        with self.open('rb') as src:
+            with dest.open('wb') as dst:
+                return _kernel_copy(
+                    src.fileno(), dst.fileno(), self.copy_bufsize)
+
+    def mmap(self, access='r', offset=0, length=None):
+        """
+        Map the file at this path to memory, and return it as a
+        ``MappedFile``.  ``access`` is 'r' for read-only access, 'w'
+        for changes to be written to the file, or 'c' for changes to
+        be kept in memory only.  ``length`` bytes from ``offset`` are
+        mapped, by default everything from ``offset``.  ``offset``
+        doesn't need to be aligned to pages.
+        """
+        (flags, mmap_access) = _mmap_modes[access]
+        fd = self._at(_libc.openat, os.open, flags)
+        try:
+            size = os.fstat(fd).st_size
+            if offset > size:
+                raise ValueError('mmap offset is greater than file size')
+            if length is None:
+                length = size - offset
+            if not length:
+                ## mmap can't map empty files
+                return MappedFile('', readonly=True)
+            ## mmap needs the offset to be aligned
+            shift = offset % _mmap.ALLOCATIONGRANULARITY
+            m = _mmap.mmap(fd, length + shift, access=mmap_access,
+                           offset=offset - shift)
+        finally:
+            os.close(fd)
+        if access == 'w':
+            flush = m.flush
+        else:
+            flush = None
+        return MappedFile(m, shift, length, readonly=(access == 'r'),
+                          flush=flush, close=m.close)
 
     def __iter__(self):
         """
@@ -34,9 +564,96 @@ class path(PathnameMixin, WalkMixin, StatWrappersMixin):
         the supposed directory isn't a directory at all, raise an
         ``OSError``.
         """
-        for item in os.listdir(self._pathname):
+        with self._listing() as pathname:
+            names = os.listdir(pathname)
+        for item in names:
             yield self.child(item)
 
+    @contextlib.contextmanager
+    def _listing(self):
+        ## the path name to list this directory by: the one of its
+        ## cached descriptor, if we have a dirfd_cache
+        if self.dirfd_cache is not None and _libc.available:
+            with self.dirfd_cache.acquire(self._pathname) as fd:
+                yield _fd_pathname(fd, self._pathname)
+        else:
+            yield self._pathname
+
+    def _walk_children(self):
+        """
+        Return a list of ``(child, isdir, islink)`` tuples for walk.
+
+        If scandir is available, the item types are taken from the
+        directory listing and nothing is stat'ed unless the file
+        system doesn't report the type.  Otherwise each item is
+        lstat'ed once, and only symlinks are stat'ed a second time.
+
+        With a ``stat_cache``, what was found out goes to it: the stat
+        results taken, or (with scandir) the types from the listing,
+        so exists, isdir, isfile and islink on the path objects walk
+        yields don't stat them again.  The types agree with each
+        other, and make way for the stat results once the path is
+        stat'ed.
+        """
+        ret = []
+        cache = self.stat_cache
+        if scandir is not None:
+            with self._listing() as pathname:
+                entries = list(scandir(pathname))
+            for entry in entries:
+                c = self.child(entry.name)
+                isdir = entry.is_dir()
+                islink = entry.is_symlink()
+                if cache is not None:
+                    cache.store(c._pathname, 'listed',
+                                (isdir, entry.is_file(), islink))
+                ret.append((c, isdir, isdir and islink))
+            return ret
+        for c in self:
+            st = c.lstat()
+            islink = stat.S_ISLNK(st.st_mode)
+            if islink:
+                try:
+                    st = c.stat()
+                except OSError:
+                    ## dangling symlink
+                    pass
+            elif cache is not None:
+                cache.store(c._pathname, 'stat', st)
+            isdir = stat.S_ISDIR(st.st_mode)
+            ret.append((c, isdir, isdir and islink))
+        return ret
+
+    def _listed(self):
+        ## (isdir, isfile, islink) from the listing walk did, if we
+        ## have them cached
+        if self.stat_cache is None:
+            return None
+        return self.stat_cache.get(self._pathname, 'listed')
+
+    def exists(self):
+        if self._listed() is not None:
+            return True
+        return super(path, self).exists()
+
+    def isdir(self):
+        listed = self._listed()
+        if listed is not None:
+            return listed[0]
+        return super(path, self).isdir()
+
+    def isfile(self):
+        listed = self._listed()
+        if listed is not None:
+            return listed[1]
+        return super(path, self).isfile()
+
+    def islink(self):
+        listed = self._listed()
+        if listed is not None:
+            return listed[2]
+        return super(path, self).islink()
+
     def rename(self, new_path):
         """
         Rename this path a new path ``new_path`` (a ``path`` object).
@@ -47,7 +664,9 @@ class path(PathnameMixin, WalkMixin, StatWrappersMixin):
         ## TODO: RFC: I think we should support passing new_path as a string
         ## TODO: RFC: when we implement wrapping of OSError / IOError,
         ## this code should probably be refactored.
-        if not hasattr(new_path, 'root') or self.root != new_path.root:
+        ## not root equality: the roots of other file systems may
+        ## well compare equal to ours
+        if not isinstance(new_path, path) or new_path.root is not self.root:
             raise CrossDeviceRenameError()
         try:
             os.rename(self._pathname, new_path._pathname)
@@ -56,6 +675,12 @@ class path(PathnameMixin, WalkMixin, StatWrappersMixin):
                 raise CrossDeviceRenameError()
             else:
                 raise
+        if self.stat_cache is not None:
+            self.stat_cache.invalidate(self._pathname, recursive=True)
+            self.stat_cache.invalidate(new_path._pathname, recursive=True)
+        if self.dirfd_cache is not None:
+            self.dirfd_cache.forget(self._pathname, recursive=True)
+            self.dirfd_cache.forget(new_path._pathname, recursive=True)
         self._pathname = new_path._pathname
 
     def stat(self):
@@ -63,10 +688,50 @@ class path(PathnameMixin, WalkMixin, StatWrappersMixin):
         Return the status information for this ``path`` object. The
         return value is of the same type as for ``os.stat``.
         """
-        return os.stat(self._pathname)
+        if self.stat_cache is None:
+            return self._stat_at(os.stat)
+        return self.stat_cache.lookup(self._pathname, 'stat',
+                                      lambda x: self._fetch_stat(os.stat))
 
     def lstat(self):
-        return os.lstat(self._pathname)
+        if self.stat_cache is None:
+            return self._stat_at(os.lstat)
+        return self.stat_cache.lookup(self._pathname, 'lstat',
+                                      lambda x: self._fetch_stat(os.lstat))
+
+    def _fetch_stat(self, func):
+        ## what the file system says now replaces the types from the
+        ## listing (see _walk_children), if it fails too
+        self.stat_cache.discard(self._pathname, 'listed')
+        return self._stat_at(func)
+
+    def _stat_at(self, func):
+        ## func (os.stat or os.lstat) relative to the cached descriptor
+        ## of the parent, like the other calls with a dirfd_cache
+        if self.dirfd_cache is None:
+            return func(self._pathname)
+        head = os.path.dirname(self._pathname)
+        def stat_at(dirfd, name):
+            return func(os.path.join(_fd_pathname(dirfd, head), name))
+        return self._at(stat_at, func)
+
+    @classmethod
+    def _stat_many(cls, paths, workers, follow_symlinks):
+        ## the stat calls release the GIL, so the threads can wait for
+        ## the disk in parallel
+        if workers <= 1 or len(paths) <= 1:
+            return [_stat_or_error(p, follow_symlinks) for p in paths]
+        def stat_one(p):
+            return _stat_or_error(p, follow_symlinks)
+        pool = ThreadPool(workers)
+        try:
+            return pool.map(stat_one, paths,
+                            max(1, len(paths) // (workers * 4)))
+        finally:
+            pool.terminate()
+
+    def _stat_cache_key(self):
+        return self._pathname
 
     def symlink(self, target):
         """
@@ -77,6 +742,7 @@ class path(PathnameMixin, WalkMixin, StatWrappersMixin):
         if not hasattr(target, 'root') or self.root != target.root:
             raise OSError(errno=errno.EXDEV)
         os.symlink(self._pathname, target._pathname)
+        target.refresh()
 
     def readlink(self):
         """
@@ -104,9 +770,14 @@ class path(PathnameMixin, WalkMixin, StatWrappersMixin):
         if not isinstance(new_group, int):
             new_group = grp.getgrnam(new_group).gr_gid
         chown_method(self._pathname, new_user, new_group)
+        self.refresh()
 
     def chown(self, new_user=None, new_group=None):
-        return self._chown(new_user, new_group, os.chown)
+        self._chown(new_user, new_group, os.chown)
+        if self.stat_cache is not None and self.islink():
+            ## we don't know which cached paths point to the same
+            ## item as the link target
+            self.stat_cache.clear()
 
     def lchown(self, new_user=None, new_group=None):
         return self._chown(new_user, new_group, os.lchown)
@@ -117,7 +788,11 @@ class path(PathnameMixin, WalkMixin, StatWrappersMixin):
 
         If the item cannot be removed, raise an ``OSError``.
         """
-        os.unlink(self._pathname)
+        self._at(_libc.unlinkat, os.unlink)
+        self.refresh()
+        if self.dirfd_cache is not None:
+            ## could have been a symlink to a directory
+            self.dirfd_cache.forget(self._pathname)
 
     remove = unlink
 
@@ -134,15 +809,55 @@ class path(PathnameMixin, WalkMixin, StatWrappersMixin):
             self.parent().mkdir(create_parents=True, may_exist=True)
             
         try:
-            os.mkdir(self._pathname)
+            self._at(_libc.mkdirat, os.mkdir)
         except OSError, e:
             if may_exist and e.errno == errno.EEXIST:
                 pass
             else:
                 raise
+        self.refresh()
 
     def rmdir(self):
-        os.rmdir(self._pathname)
+        self._at(_rmdirat, os.rmdir)
+        self.refresh()
+        if self.dirfd_cache is not None:
+            self.dirfd_cache.forget(self._pathname)
+
+    def rmtree(self, workers=4, onerror=None):
+        """
+        Remove the directory tree at this path.  Symlinks are removed,
+        never followed.
+
+        The items are opened and removed relative to a descriptor of
+        their directory (openat, unlinkat) if the platform allows, so
+        a directory in the tree replaced by a symlink meanwhile can't
+        make us remove anything outside of it.  Their types are
+        taken from the directory listing rather than by stat'ing them
+        where scandir is available, and the subtrees are removed in
+        parallel on a pool of ``workers`` threads.
+
+        The rest of the tree is removed even if some items can't be.
+        Then ``onerror`` is called with each of the errors, or without
+        ``onerror`` the first of them is raised.
+        """
+        st = os.lstat(self._pathname)
+        if not stat.S_ISDIR(st.st_mode):
+            raise OSError(errno.ENOTDIR, os.strerror(errno.ENOTDIR),
+                          self._pathname)
+        try:
+            ## a name and the directory it's in, also for relative
+            ## path names and ones ending with a slash
+            errors = _TreeRemover(workers).run(
+                os.path.abspath(self._pathname), st)
+        finally:
+            if self.stat_cache is not None:
+                self.stat_cache.invalidate(self._pathname, recursive=True)
+            if self.dirfd_cache is not None:
+                self.dirfd_cache.forget(self._pathname, recursive=True)
+        for e in errors:
+            if onerror is None:
+                raise e
+            onerror(e)
 
 root = path(u'/')
 ## RFC: I want every path for every file system to have a root object for identification purposes.
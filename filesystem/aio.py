@@ -0,0 +1,313 @@
+"""
+Non-blocking access to the path objects of any file system, for
+programs built around an event loop.
+
+``path(p)`` wraps the path ``p``.  The methods doing IO don't block,
+they return a ``Future`` for the result instead, which calls its
+callbacks when done (see ``Future.add_done_callback``).  The calls
+on file systems that may block are run on the threads of an
+``Executor``, the in-memory file system is called right away and
+returns futures that are done already:
+
+    def got_stat(future):
+        print future.result().st_size
+
+    filesystem.aio.path(filesystem.path(u'/etc/passwd')).stat(
+        ).add_done_callback(got_stat)
+
+File systems tell whether they may block with the class attribute
+``blocking_io``, without it they're assumed to.
+"""
+from __future__ import with_statement
+import sys
+import threading
+import collections
+from multiprocessing.pool import ThreadPool
+
+class Future(object):
+    """
+    The result of a call, once it's done.  Has the methods of the
+    futures in ``concurrent.futures`` but cancel.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._callbacks = []
+        self._result = None
+        self._exc_info = None
+
+    def _run(self, func, args, kwargs):
+        try:
+            self._result = func(*args, **kwargs)
+        except Exception:
+            self._exc_info = sys.exc_info()
+        with self._lock:
+            self._done.set()
+            callbacks = self._callbacks
+            self._callbacks = None
+        for callback in callbacks:
+            callback(self)
+
+    def done(self):
+        return self._done.is_set()
+
+    def add_done_callback(self, callback):
+        """
+        Call ``callback(future)`` when the call is done, right away if
+        it is already.  The callback is called on the thread that
+        did the call, for an event loop it has to hand the result
+        over to the loop thread.
+        """
+        with self._lock:
+            if self._callbacks is not None:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def result(self, timeout=None):
+        """
+        Wait for the call to be done, and return its result or raise
+        its exception.
+        """
+        self._wait(timeout)
+        if self._exc_info is not None:
+            (cls, e, tb) = self._exc_info
+            raise cls, e, tb
+        return self._result
+
+    def exception(self, timeout=None):
+        self._wait(timeout)
+        if self._exc_info is not None:
+            return self._exc_info[1]
+        return None
+
+    def _wait(self, timeout):
+        if not self._done.wait(timeout):
+            raise RuntimeError('timed out waiting for the result')
+
+class Executor(object):
+    """
+    Runs the blocking calls on a pool of ``workers`` threads, so at
+    most ``workers`` of them are running at any one time.  The ones
+    waiting for a thread are queued.
+    """
+    def __init__(self, workers=4):
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Call ``func(*args, **kwargs)`` on a pool thread, and return a
+        ``Future`` for the result.
+        """
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPool(self.workers)
+        future = Future()
+        self._pool.apply_async(future._run, (func, args, kwargs))
+        return future
+
+    def shutdown(self):
+        """
+        Stop the threads once the calls submitted are done.
+        """
+        with self._lock:
+            pool = self._pool
+            self._pool = None
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+_default_executor = None
+_default_executor_lock = threading.Lock()
+
+def _get_default_executor():
+    global _default_executor
+    if _default_executor is None:
+        with _default_executor_lock:
+            if _default_executor is None:
+                _default_executor = Executor()
+    return _default_executor
+
+def _unwrap(p):
+    if isinstance(p, path):
+        return p.wrapped
+    return p
+
+class _Wrapper(object):
+    ## the common part of path and file: running the calls
+    def __init__(self, wrapped, executor, blocking):
+        self.wrapped = wrapped
+        self.executor = executor
+        self._blocking = blocking
+
+    def _call(self, func, *args, **kwargs):
+        if self._blocking:
+            return self.executor.submit(func, *args, **kwargs)
+        future = Future()
+        future._run(func, args, kwargs)
+        return future
+
+class path(_Wrapper):
+    """
+    Wraps the path object ``wrapped`` of any file system.  The calls
+    doing IO are run on ``executor``, a shared default ``Executor``
+    if not given, unless the file system has ``blocking_io`` false.
+
+    The methods not doing IO (child, join, parent and name) return
+    the result right away, like those of the wrapped path.
+    """
+    def __init__(self, wrapped, executor=None):
+        if executor is None:
+            executor = _get_default_executor()
+        super(path, self).__init__(
+            wrapped, executor, getattr(wrapped, 'blocking_io', True))
+
+    def _wrap(self, p):
+        return path(p, self.executor)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.wrapped)
+
+    def __eq__(self, other):
+        return self.wrapped == _unwrap(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.wrapped)
+
+    def child(self, *segments):
+        return self._wrap(self.wrapped.child(*segments))
+
+    def join(self, relpath):
+        return self._wrap(self.wrapped.join(relpath))
+
+    def parent(self):
+        return self._wrap(self.wrapped.parent())
+
+    def name(self):
+        return self.wrapped.name()
+
+    def stat(self):
+        return self._call(self.wrapped.stat)
+
+    def lstat(self):
+        return self._call(self.wrapped.lstat)
+
+    def exists(self):
+        return self._call(self.wrapped.exists)
+
+    def isdir(self):
+        return self._call(self.wrapped.isdir)
+
+    def isfile(self):
+        return self._call(self.wrapped.isfile)
+
+    def islink(self):
+        return self._call(self.wrapped.islink)
+
+    def size(self):
+        return self._call(self.wrapped.size)
+
+    def mkdir(self, *args, **kwargs):
+        return self._call(self.wrapped.mkdir, *args, **kwargs)
+
+    def rmdir(self):
+        return self._call(self.wrapped.rmdir)
+
+    def unlink(self):
+        return self._call(self.wrapped.unlink)
+
+    remove = unlink
+
+    def rename(self, new_path):
+        return self._call(self.wrapped.rename, _unwrap(new_path))
+
+    def open(self, *args, **kwargs):
+        """
+        Open the file, the future gives a ``file`` object wrapping the
+        file object of the file system.
+        """
+        def open_file():
+            return file(self.wrapped.open(*args, **kwargs),
+                        self.executor, self._blocking)
+        return self._call(open_file)
+
+    def iterdir(self):
+        """
+        List the directory, the future gives a list of the children.
+        """
+        def listdir():
+            return [self._wrap(x) for x in self.wrapped]
+        return self._call(listdir)
+
+    def walk(self, **kwargs):
+        """
+        Walk the directory tree like the walk method of the wrapped
+        path, the future gives the list of 3-tuples it yields.  As
+        the whole walk is done before the result is there, the
+        subdirectory lists can't be changed to prune it.
+        """
+        def walk():
+            return [(self._wrap(d), [self._wrap(x) for x in subdirs],
+                     [self._wrap(x) for x in nondirs])
+                    for (d, subdirs, nondirs)
+                    in self.wrapped.walk(**kwargs)]
+        return self._call(walk)
+
+class file(_Wrapper):
+    """
+    Wraps a file object opened through ``path.open``.  The methods
+    return futures.  The calls are run one at a time, in the order
+    they're made, as the file position is shared by all of them.
+    """
+    def __init__(self, wrapped, executor, blocking):
+        super(file, self).__init__(wrapped, executor, blocking)
+        self._lock = threading.Lock()
+        self._pending = collections.deque()
+        self._running = False
+
+    def _call_in_order(self, name, *args):
+        if not self._blocking:
+            return self._call(getattr(self.wrapped, name), *args)
+        future = Future()
+        with self._lock:
+            self._pending.append((future, name, args))
+            if self._running:
+                return future
+            self._running = True
+        ## one job on the executor at a time per file, running the
+        ## calls queued until there are none
+        self.executor.submit(self._run_pending)
+        return future
+
+    def _run_pending(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._running = False
+                    return
+                (future, name, args) = self._pending.popleft()
+            future._run(getattr(self.wrapped, name), args, {})
+
+    def read(self, *args):
+        return self._call_in_order('read', *args)
+
+    def write(self, data):
+        return self._call_in_order('write', data)
+
+    def seek(self, *args):
+        return self._call_in_order('seek', *args)
+
+    def tell(self):
+        return self._call_in_order('tell')
+
+    def flush(self):
+        return self._call_in_order('flush')
+
+    def close(self):
+        return self._call_in_order('close')
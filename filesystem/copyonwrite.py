@@ -1,40 +1,227 @@
+from __future__ import with_statement
+import errno
+import os
 import filesystem
 import filesystem.multiplexing
 
+class _BlockStore(object):
+    """
+    The content of a file copied up from the bound file system.  It
+    stands in for the bytearray of an inmem file, supporting the
+    operations the inmem file objects use on it.  Only the blocks
+    written to are kept in memory, the others are read from the
+    bound file as needed.
+    """
+    __slots__ = ('_lower', '_lower_size', '_size', '_block_size', '_blocks',
+                 '_file', '_last')
+
+    def __init__(self, lower, block_size):
+        self._lower = lower
+        self._size = self._lower_size = lower.size()
+        self._block_size = block_size
+        ## block number -> bytearray of block_size bytes
+        self._blocks = {}
+        ## the bound file, opened once it's read from
+        self._file = None
+        ## (block number, content) of the last block read from the
+        ## bound file, as readline reads it twice: to find the end of
+        ## the line, and to read the line
+        self._last = None
+
+    def __len__(self):
+        return self._size
+
+    def __str__(self):
+        return self[:]
+
+    def _read_lower(self, start, stop):
+        ## bytes beyond the end of the bound file were truncated away,
+        ## they read as zeros
+        end = min(stop, self._lower_size)
+        data = ''
+        if start < end:
+            if self._file is None:
+                self._file = self._lower.open('rb')
+            self._file.seek(start)
+            data = self._file.read(end - start)
+        return data + '\0' * (stop - start - len(data))
+
+    def _block_data(self, n):
+        ## block n, in memory or as read from the bound file; it may go
+        ## beyond the end of the file
+        block = self._blocks.get(n)
+        if block is not None:
+            return block
+        if self._last is None or self._last[0] != n:
+            start = n * self._block_size
+            self._last = (n, self._read_lower(
+                start, min(start + self._block_size, self._size)))
+        return self._last[1]
+
+    def _block(self, n):
+        ## the block to write to, read from the bound file if it's not
+        ## in memory yet
+        block = self._blocks.get(n)
+        if block is None:
+            start = n * self._block_size
+            block = bytearray(
+                self._read_lower(start, start + self._block_size))
+            self._blocks[n] = block
+        return block
+
+    def __getitem__(self, key):
+        (start, stop, step) = key.indices(self._size)
+        if step != 1:
+            return self[start:stop][::step]
+        bs = self._block_size
+        parts = []
+        pos = start
+        while pos < stop:
+            n = pos // bs
+            end = min((n + 1) * bs, stop)
+            block = self._blocks.get(n)
+            if block is not None:
+                parts.append(str(buffer(block, pos - n * bs, end - pos)))
+            elif end < stop and (end // bs) not in self._blocks:
+                ## read the following blocks not in memory at once
+                while end < stop and (end // bs) not in self._blocks:
+                    end = min(end + bs, stop)
+                parts.append(self._read_lower(pos, end))
+            else:
+                parts.append(self._block_data(n)[pos - n * bs:end - n * bs])
+            pos = end
+        return ''.join(parts)
+
+    def __setitem__(self, key, value):
+        start = key.start or 0
+        stop = key.stop
+        if (key.step not in (None, 1) or start > self._size or
+            stop - start != len(value)):
+            raise ValueError('only writes of the slice length are supported')
+        bs = self._block_size
+        pos = start
+        while pos < stop:
+            n = pos // bs
+            end = min((n + 1) * bs, stop)
+            self._block(n)[pos - n * bs:end - n * bs] = \
+                value[pos - start:end - start]
+            pos = end
+        self._size = max(self._size, stop)
+
+    def __delitem__(self, key):
+        (start, stop, step) = key.indices(self._size)
+        if step != 1 or stop != self._size:
+            raise ValueError('only truncation is supported')
+        self._size = start
+        self._lower_size = min(self._lower_size, start)
+        self._last = None
+        bs = self._block_size
+        for n in self._blocks.keys():
+            if n * bs >= start:
+                del self._blocks[n]
+        n = start // bs
+        if n in self._blocks:
+            ## if the file grows again, the bytes must read as zeros
+            block = self._blocks[n]
+            block[start - n * bs:] = '\0' * (bs - (start - n * bs))
+
+    def extend(self, value):
+        self[self._size:self._size + len(value)] = value
+
+    def find(self, sub, start=0):
+        bs = self._block_size
+        pos = max(start, 0)
+        while pos < self._size:
+            n = pos // bs
+            base = n * bs
+            i = self._block_data(n).find(sub, pos - base,
+                                         min(bs, self._size - base))
+            if i >= 0:
+                return base + i
+            pos = base + bs
+            if len(sub) > 1 and pos < self._size:
+                ## sub may span the block boundary
+                head = max(pos - len(sub) + 1, start)
+                i = self[head:pos + len(sub) - 1].find(sub)
+                if i >= 0:
+                    return head + i
+        return -1
+
 class path(filesystem.multiplexing.path):
     _supercede_attributes = (
         filesystem.multiplexing.path._supercede_attributes +
-        ('open', 'mkdir', 'rmdir', 'unlink', 'remove'))
-    
+        ('open', 'mkdir', 'rmdir', 'rmtree', 'unlink', 'remove', 'mmap'))
+    __slots__ = ()
+
+    ## the granularity of copying up files opened for update
+    _block_size = 64 * 1024
+
     def __init__(self, bind=None, **kwargs):
-        super(path, self).__init__(**kwargs)
-        if bind:
-            self._bound = bind
-        else:
-            self._bound = getattr(kwargs.get('parent',''), '_bind', None)
+        if not bind:
+            bind = getattr(kwargs.get('parent',''), '_bind', None)
+        super(path, self).__init__(bind=bind, **kwargs)
     
+    @filesystem.multiplexing._on_node
     def open(self, mode='r', *moreargs, **kwargs):
         if 'w' in mode:
             self.unbind()
-        ## TODO: we don't have test code for this yet
-        #elif mode == 'r+':
-            #with self._bind.open('r', *moreargs, **kwargs) as f:
-                #self._file = f.read()
+        elif '+' in mode or 'a' in mode:
+            self._copy_up()
         if self._bound:
             return self._bound.open(mode, *moreargs, **kwargs)
         else:
             return super(path, self).open(mode, *moreargs, **kwargs)
 
+    @filesystem.multiplexing._on_node
+    def mmap(self, access='r', *args, **kwargs):
+        if access == 'w':
+            ## the changes must not reach the bound file
+            self._copy_up()
+        if self._bound:
+            return self._bound.mmap(access, *args, **kwargs)
+        return super(path, self).mmap(access, *args, **kwargs)
+
+    def _copy_up(self):
+        """
+        Unbind a file about to be modified, keeping its content.  The
+        content is copied from the bound file block by block as it's
+        modified.
+        """
+        lower = self._bound
+        if not lower:
+            return
+        if lower.exists() and lower.isdir():
+            raise IOError(errno.EISDIR, os.strerror(errno.EISDIR),
+                          unicode(lower))
+        self.unbind()
+        if lower.exists() and lower.isfile():
+            node = self._node()
+            node._set_stat(lower.stat().st_mode)
+            node._data = _BlockStore(lower, self._block_size)
+
+    @filesystem.multiplexing._on_node
+    def unlink(self):
+        super(path, self).unlink()
+        ## unbound and not existing in this tree, the node hides the
+        ## bound file, if any
+        self.unbind()
+
+    remove = unlink
+
+    @filesystem.multiplexing._on_node
     def mkdir(self, *args, **kwargs):
         self.unbind()
         return super(path, self).mkdir(*args, **kwargs)
 
+    @filesystem.multiplexing._on_node
     def rename(self, new_path):
         if self._bound:
             tmp_bound = self._bound
             self.unbind()
-            self.rename(new_path)
-            self.bind(tmp_bound)
+            try:
+                self.rename(new_path)
+            finally:
+                self.bind(tmp_bound)
             return
         if getattr(new_path, '_bound', False):
             new_path.unbind()
@@ -7,60 +7,207 @@ same pathname and read the contents.
 import filesystem
 import stat
 import posix
-import StringIO
 import errno
+import hashlib
 
-class _VirtualFile(StringIO.StringIO):
+## Stat fields are shared between the nodes, there may be millions
+## of nodes but few distinct modes.
+_stat_fields = {}
+
+def _intern(name):
+    ## a table of our own for the names would never shrink; python
+    ## drops interned strs when they're no longer used, but it can't
+    ## intern unicode
+    if type(name) is str:
+        return intern(name)
+    return name
+
+def _closed():
+    raise ValueError('I/O operation on closed file')
+
+class _VirtualFile(object):
     """
-    A StringIO class that is specialized to be used for the inmem fs.
+    An open file of the inmem fs.
     """
-    ## This class is a wrapper class, the real content is stored in
-    ## self._path._file, which we for the convenience copy to
-    ## self._path.  Except for self._path and self._file, we keep
-    ## self.pos in this wrapper, since that's the only thing that is
-    ## different between the different open files.
+    ## The content is the bytearray path._data, shared by all the open
+    ## files of the path.  We keep a reference to it rather than to
+    ## the path, so that an open file still works after the path is
+    ## renamed or unlinked, as on a real file system.  Only the
+    ## position differs between the open files.  path._data may be
+    ## something else than a bytearray (see copyonwrite), as long as
+    ## it supports len, slicing, assignment to slices of the same
+    ## length, deleting a tail slice, extend and find.
+    __slots__ = ('_data', 'mode', 'pos', 'closed', '_append')
+
     def __init__(self, path, mode=u''):
-        ## we'll have to use __dict__ here to get around __setattr__
-        self.__dict__['_path'] = path
-        self.__dict__['_file'] = path._file
-        self.__dict__['pos'] = 0
-        
-        if mode.startswith(u'w'):
-            self.truncate()
+        self._data = path._data
+        self.mode = mode
+        self.pos = 0
+        self.closed = False
+        self._append = mode.startswith(u'a')
 
-        if mode.startswith(u'a'):
-            self.seek(self.len)
+        if mode.startswith(u'w'):
+            self.truncate(0)
 
-    def __getattr__(self, item):
-        return getattr(self._file, item)
+        if self._append:
+            self.pos = len(self._data)
 
-    def __setattr__(self, item, newvalue):
-        if item == 'pos':
-            self.__dict__[item] = newvalue
-        else:
-            return setattr(self._file, item, newvalue)
+    def __enter__(self):
+        return self
 
     def __exit__(self, a, b, c):
-        pass
+        self.close()
 
-    def close(self):
-        pass
-    
-    def __enter__(self):
+    def __iter__(self):
         return self
 
-class path(filesystem.WalkMixin, filesystem.StatWrappersMixin, filesystem.SimpleComparitionMixin):
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def close(self):
+        self.closed = True
+
+    def flush(self):
+        if self.closed:
+            _closed()
+
+    def isatty(self):
+        if self.closed:
+            _closed()
+        return False
+
+    def tell(self):
+        if self.closed:
+            _closed()
+        return self.pos
+
+    def seek(self, pos, mode=0):
+        if self.closed:
+            _closed()
+        if mode == 1:
+            pos += self.pos
+        elif mode == 2:
+            pos += len(self._data)
+        self.pos = max(0, pos)
+
+    def _end(self, n):
+        size = len(self._data)
+        if n is None or n < 0:
+            return size
+        return min(self.pos + n, size)
+
+    def read(self, n=-1):
+        if self.closed:
+            _closed()
+        pos = self.pos
+        end = self._end(n)
+        if end <= pos:
+            return ''
+        self.pos = end
+        data = self._data
+        if type(data) is bytearray:
+            ## one copy, straight from the bytearray to the string
+            return str(buffer(data, pos, end - pos))
+        return data[pos:end]
+
+    def readinto(self, b):
+        """
+        Read into the writable buffer ``b`` (a bytearray or a
+        memoryview), returns the number of bytes read.
+        """
+        if self.closed:
+            _closed()
+        pos = self.pos
+        end = self._end(len(b))
+        if end <= pos:
+            return 0
+        n = end - pos
+        b[:n] = self._data[pos:end]
+        self.pos = end
+        return n
+
+    def readline(self, size=-1):
+        if self.closed:
+            _closed()
+        end = self._data.find('\n', self.pos) + 1
+        if end == 0:
+            end = len(self._data)
+        if size is not None and size >= 0:
+            end = min(end, self.pos + size)
+        return self.read(end - self.pos)
+
+    def readlines(self, sizehint=0):
+        lines = []
+        total = 0
+        for line in self:
+            lines.append(line)
+            total += len(line)
+            if 0 < sizehint <= total:
+                break
+        return lines
+
+    def write(self, s):
+        if self.closed:
+            _closed()
+        if isinstance(s, unicode):
+            ## the same implicit encoding as a real file does
+            s = str(s)
+        data = self._data
+        if self._append:
+            self.pos = len(data)
+        pos = self.pos
+        if pos > len(data):
+            data.extend('\0' * (pos - len(data)))
+        n = len(s)
+        data[pos:pos+n] = s
+        self.pos = pos + n
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def truncate(self, size=None):
+        if self.closed:
+            _closed()
+        if size is None:
+            size = self.pos
+        del self._data[size:]
+
+    def getvalue(self):
+        return str(self._data)
+
+class path(filesystem.WalkMixin, filesystem.StatWrappersMixin,
+           filesystem.CopyMixin, filesystem.ChecksumMixin,
+           filesystem.SimpleComparitionMixin):
     """
     An in-memory path.
 
     In the local file system, the same path can be expressed through
-    equal but distinct objects, in this file system we should have
-    only one path object for each distinct path (TODO: rename breaks
-    with this.  It's the only way to follow the API.  RFC: Should the
-    API be changed?).  Creating a new path object is equivalent with
-    creating a new distinct file system - the file system has to be
-    traversed through .child() or .join()
+    equal but distinct objects.  In this file system, each existing
+    path has one node in the tree, and there may be any number of
+    detached handles for the same path.  child() returns a detached
+    handle for a child that doesn't exist.  The handle is added to
+    the tree when the file or directory is created.  Until then, all
+    operations on it go to the node that was created for the path
+    since, if there is one.  Creating a new path object is equivalent
+    with creating a new distinct file system - the file system has to
+    be traversed through .child() or .join()
     """
+    ## Nodes are kept small: no instance dict, no map of children
+    ## before there are any, and no file content but for files.
+    __slots__ = ('_parent', '_name', '_children', '_stat', '_stat_result',
+                 '_data', '_seen')
+
+    ## counts the removals of non-empty directories; the nodes below
+    ## one stay as they were, until they're looked at (see _node)
+    _removals = 0
+
+    ## nothing here waits for a disk, see filesystem.aio
+    blocking_io = False
+
     def __init__(self, name=u'', parent=None):
         if u'/' in name:
             ## TODO: untested code line
@@ -72,24 +219,98 @@ class path(filesystem.WalkMixin, filesystem.StatWrappersMixin, filesystem.Simple
         else:
             self._parent = parent
         self._name = name
-        self._children = {}
+        self._children = None
+        ## the stat fields but st_size, which is len(self._data)
         self._stat = ()
-        self._file = StringIO.StringIO()
+        self._stat_result = None
+        self._data = None
+        self._seen = -1
+        self._hash = None
+
+    def _node(self):
+        """
+        The node in the tree for this path.  That is self, unless self
+        is a detached handle and the path has been created through
+        some other handle.
+        """
+        if self._parent is self:
+            return self
+        ## existing nodes are in the tree, unless a directory above
+        ## them has been removed since they were last seen
+        if self._stat and (self._seen == path._removals or self._in_tree()):
+            return self
+        children = self._parent._children
+        if children and children.get(self._name) is self:
+            return self
+        children = self._parent._node()._children
+        if children:
+            node = children.get(self._name)
+            if node is not None:
+                return node
+        return self
+
+    def _in_tree(self):
+        chain = []
+        node = self
+        while node._parent is not node:
+            chain.append(node)
+            children = node._parent._children
+            if not children or children.get(node._name) is not node:
+                ## below a removed directory: the nodes up to it are
+                ## gone too, and become handles
+                for node in chain:
+                    node._data = None
+                    node._children = None
+                    node._set_stat(None)
+                return False
+            node = node._parent
+        for node in chain:
+            node._seen = path._removals
+        return True
+
+    def _attach(self):
+        ## self must be the result of self._node()
+        if self._parent is self:
+            return
+        parent = self._parent._node()
+        if parent._children is None:
+            parent._children = {}
+        self._parent = parent
+        self._name = _intern(self._name)
+        parent._children[self._name] = self
 
-    #def __eq__(self, other):
-        ## as said above, two equal paths should always be same object.
-        #return self is other
+    def _detach(self):
+        if self._parent is self:
+            return
+        children = self._parent._children
+        if children and children.get(self._name) is self:
+            del children[self._name]
 
     def stat(self):
-        if not self._stat:
+        node = self._node()
+        if not node._stat:
             e = OSError()
             e.errno = errno.ENOENT
             raise e
-        if self._file:
-            self._stat[6] = self._file.len
-        ## bloat ... turning a list to a sequence to a stat_result object ;-)
-        ## Well, StringIO implementation is not quite optimal anyway ;-)
-        return posix.stat_result(list(self._stat))
+        size = 0
+        if node._data is not None:
+            size = len(node._data)
+        st = node._stat_result
+        if st is None or st.st_size != size:
+            st = posix.stat_result(node._stat[:6] + (size,) + node._stat[7:])
+            node._stat_result = st
+        return st
+
+    def _set_stat(self, mode):
+        if mode:
+            fields = _stat_fields.get(mode)
+            if fields is None:
+                fields = (mode, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+                _stat_fields[mode] = fields
+            self._stat = fields
+        else:
+            self._stat = ()
+        self._stat_result = None
 
     def parent(self):
         return self._parent
@@ -97,23 +318,49 @@ class path(filesystem.WalkMixin, filesystem.StatWrappersMixin, filesystem.Simple
     def name(self):
         return self._name
 
+    def _top(self):
+        p = self
+        while p._parent is not p:
+            p = p._parent
+        return p
+
     def rename(self, newpath):
+        if not isinstance(newpath, path) or newpath._top() is not self._top():
+            raise filesystem.CrossDeviceRenameError()
         newpath.parent().mkdir(may_exist=True, create_parents=True)
-        newpath._file = self._file
-        newpath._children = self._children
-        newpath._stat = self._stat
-        self._parent._children.pop(self._name)
-        self._name = newpath._name
-        self._parent = newpath._parent
+        node = self._node()
+        target = newpath._node()
+        if target is node:
+            return
+        ## the node is moved in place of the target, which is emptied
+        ## and left as a handle resolving to the node
+        node._detach()
+        target._detach()
+        self._paths_moved()
+        if target._children:
+            path._removals += 1
+        target._data = None
+        target._children = None
+        target._set_stat(None)
+        node._name = target._name
+        node._parent = target._parent
+        node._attach()
+        ## the handle the caller has mutates to the new path too
+        self._name = node._name
+        self._parent = node._parent
 
     def unlink(self):
         if not self.exists():
             e = OSError()
             e.errno = errno.ENOENT
             raise e
-        self._file = None
-        self._children = {}
-        self._stat = ()
+        node = self._node()
+        if node._children:
+            path._removals += 1
+        node._data = None
+        node._children = None
+        node._set_stat(None)
+        node._detach()
         
     remove = unlink
 
@@ -124,6 +371,15 @@ class path(filesystem.WalkMixin, filesystem.StatWrappersMixin, filesystem.Simple
             raise e
         self.unlink()
         
+    def rmtree(self, workers=4, onerror=None):
+        ## the subtree goes with its directory, whatever its size
+        try:
+            self.rmdir()
+        except OSError, e:
+            if onerror is None:
+                raise
+            onerror(e)
+
     def join(self, relpath):
         if relpath.startswith(u'/'):
             raise filesystem.InsecurePathError(u'path name to join must be relative')
@@ -133,23 +389,67 @@ class path(filesystem.WalkMixin, filesystem.StatWrappersMixin, filesystem.Simple
         if not segment:
             return self
         
-        if not self._children.has_key(segment):
+        node = self._node()
+        ret = None
+        if node._children:
+            ret = node._children.get(segment)
+        if ret is None:
             filesystem.raise_on_insecure_file_name(segment)
-            child = self.__class__(name=segment, parent=self)
-            self._children[segment] = child
-            
-        ret = self._children[segment]
-        
+            ret = self.__class__(name=segment, parent=node)
+
         if segments:
             return ret.child(*segments)
         else:
             return ret
 
     def open(self, mode=u'r', *args, **kwargs):
+        node = self._node()
         if not self.exists():
-            self._stat = [stat.S_IFREG + 0777, 0,0,0,0,0,0,0,0,0]
-        return _VirtualFile(self, mode)
+            ## a file can't be added to a directory that is not in the
+            ## tree
+            parent = self.parent()
+            if parent is not self and not (
+                parent.exists() and parent.isdir()):
+                e = IOError()
+                e.errno = errno.ENOENT
+                raise e
+            node._set_stat(stat.S_IFREG + 0777)
+            node._data = bytearray()
+            node._attach()
+        elif self.isdir():
+            e = IOError()
+            e.errno = errno.EISDIR
+            raise e
+        return _VirtualFile(node, mode)
     
+    def _checksum(self, algo):
+        ## hashing the content where it is, rather than reading a
+        ## copy of it
+        data = self._node()._data
+        if not isinstance(data, bytearray):
+            return super(path, self)._checksum(algo)
+        return hashlib.new(algo, data).hexdigest()
+
+    def mmap(self, access='r', offset=0, length=None):
+        """
+        Give access to the file content through the same API as the
+        mmap method of the local file system.  Only the 'c' mappings
+        copy the file content, the others map the bytearray itself.
+        """
+        if not self.isfile():
+            e = OSError()
+            e.errno = errno.ENODEV
+            raise e
+        data = self._node()._data
+        if offset > len(data):
+            raise ValueError('mmap offset is greater than file size')
+        if access == 'c':
+            if type(data) is not bytearray:
+                data = data[:]
+            data = bytearray(data)
+        return filesystem.MappedFile(
+            data, offset, length, readonly=(access == 'r'))
+
     def mkdir(self, may_exist=False, create_parents=False):
         ## TODO: those lines are copied from _localfs.py, consider refactoring
         ## if it's needed in more classes.
@@ -161,13 +461,15 @@ class path(filesystem.WalkMixin, filesystem.StatWrappersMixin, filesystem.Simple
                 err.errno = errno.ENOENT
                 raise err
 
-        if self._stat:
+        node = self._node()
+        if node._stat:
             if not may_exist or not self.isdir():
                 err = OSError()
                 err.errno = errno.EEXIST
                 raise err
         else:
-            self._stat = [stat.S_IFDIR+0777, 0,0,0,0,0,0,0,0,0]
+            node._set_stat(stat.S_IFDIR + 0777)
+            node._attach()
     
     def __iter__(self):
         if not self.isdir():
@@ -177,7 +479,11 @@ class path(filesystem.WalkMixin, filesystem.StatWrappersMixin, filesystem.Simple
             else:
                 e.errno = errno.ENOENT
             raise e
-        return [x for x in self._children.values() if x.exists()].__iter__()
+        children = self._node()._children
+        if not children:
+            return iter(())
+        ## only existing nodes are in the tree
+        return iter(children.values())
 
 root = path()
 root.mkdir(may_exist=True, create_parents=True)
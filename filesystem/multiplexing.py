@@ -9,65 +9,225 @@ i.e.:
 TODO: more test code and more documentation
 """
 
+import time
+
 import filesystem
 import filesystem.inmem
 
-def _has_common_ancestor(self, other):
-    ## TODO RFC: maybe make this a method of all the filesystem
-    ## classes?
-    ## TODO: may probably be optimized.
-    prev = None
-    trail = []
-    while prev is not other:
-        trail.append(other)
-        prev = other
-        other = other.parent()
-    while not self in trail:
-        p = self.parent()
-        if p == self:
-            return False
-        self = self.parent()
-    return self
+class _delegate(object):
+    """
+    Descriptor giving the attribute of the same name of the bound
+    path.
+    """
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        ## the common case of a node in the tree first, see path._node
+        children = obj._parent._children
+        if not (children and children.get(obj._name) is obj):
+            node = obj._node()
+            if node is not obj:
+                return getattr(node, self.name)
+        return getattr(obj._bound, self.name)
+
+def _getattr_bound(self, item):
+    ## attributes the bound path has and we don't
+    if item.startswith('_'):
+        raise AttributeError(item)
+    node = self._node()
+    if node is not self:
+        return getattr(node, item)
+    return getattr(self._bound, item)
+
+def _on_node(method):
+    """
+    Decorator for methods that use the binding, running them on the
+    node in the tree for the path when called on a handle that has
+    got one since (see path._materialize).
+    """
+    def wrapper(self, *args, **kwargs):
+        node = self._node()
+        if node is not self:
+            return getattr(node, method.__name__)(*args, **kwargs)
+        return method(self, *args, **kwargs)
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+_bound_classes = {}
+
+def _bound_class(cls):
+    """
+    The class of the bound nodes of ``cls``: a subclass delegating
+    all public attributes but the ones in _supercede_attributes to
+    the bound path.
+    """
+    try:
+        return _bound_classes[cls]
+    except KeyError:
+        pass
+    attrs = {'__slots__': (), '__getattr__': _getattr_bound,
+             '_unbound_class': cls}
+    for name in dir(cls):
+        if not name.startswith('_') and name not in cls._supercede_attributes:
+            attrs[name] = _delegate(name)
+    bound_cls = type(cls.__name__, (cls,), attrs)
+    _bound_classes[cls] = bound_cls
+    return bound_cls
 
 
 class path(filesystem.inmem.path):
     _supercede_attributes = (
                 'bind', 'parent', 'unbind', 'child',
-                'join', 'name', 'rename', 'walk')
-    
+                'join', 'name', 'rename', 'walk', 'parallel_walk',
+                'glob', 'rglob', 'copytree', 'move', 'depth',
+                'is_relative_to', 'common_ancestor', 'disk_usage',
+                'checksum_tree')
+    __slots__ = ('_bound', '_listing')
+
+    ## set in the subclasses made by _bound_class
+    _unbound_class = None
+
+    ## listings look at the bound paths, bound nodes give the
+    ## blocking_io of their bound path
+    blocking_io = True
+
     def __init__(self, *args, **kwargs):
-        self._bound = None
+        self._listing = None
+        self._set_bound(kwargs.pop('bind', None))
         super(path, self).__init__(*args, **kwargs)
 
-    def __getattribute__(self, item):
-        if (object.__getattribute__(self, '_bound') and 
-            not item.startswith('_') and
-            item not in self._supercede_attributes): 
-            return getattr(object.__getattribute__(self, '_bound'), item)
-        else:
-            return object.__getattribute__(self, item)
+    def _set_bound(self, bound):
+        ## Rather than checking for a binding on every attribute
+        ## access, bound nodes are switched to a subclass delegating
+        ## to the bound path.
+        self._bound = bound
+        cls = self.__class__
+        cls = cls._unbound_class or cls
+        if bound:
+            cls = _bound_classes.get(cls) or _bound_class(cls)
+        if self.__class__ is not cls:
+            self.__class__ = cls
+
+    ## The nodes in the tree are the mount table: a path is looked up
+    ## through the nodes down to the deepest bound one, below that the
+    ## paths returned are handles bound to the corresponding paths of
+    ## the bound file system, which are only added to the tree when
+    ## they get state of their own (i.e. are bound or unbound).
+
+    def _materialize(self):
+        """
+        Add this path to the tree, if it's a handle, and return the
+        node in the tree for it.
+        """
+        parent = self._parent
+        if parent is self:
+            return self
+        children = parent._children
+        if children and children.get(self._name) is self:
+            return self
+        parent._materialize()
+        node = self._node()
+        if node is self:
+            self._attach()
+        return node
+
+    def _attach(self):
+        if self._parent is not self:
+            self._parent._materialize()
+        super(path, self)._attach()
 
     def bind(self, path):
-        self._bound = path
+        node = self._materialize()
+        node._set_bound(path)
+        node._listing = None
+        if node is not self:
+            self._set_bound(path)
 
     def unbind(self):
-        self._bound = False
+        node = self._materialize()
+        node._set_bound(False)
+        node._listing = None
+        if node is not self:
+            self._set_bound(False)
+
+    def _stat_via(self):
+        ## bound paths are stat'ed by the file system they're bound to
+        node = self._node()
+        return node._bound or node
 
     def child(self, segment=None, *segments):
-        if not segment:
-            return self
-        childnode = super(path, self).child(segment)
-        assert hasattr(self, '_bound')
-        if self._bound and childnode._bound is None:
-            childnode._bound = self._bound.child(segment)
-        return childnode.child(*segments)
+        node = self._node()
+        for segment in (segment,) + segments:
+            if not segment:
+                break
+            children = node._children
+            childnode = None
+            if children:
+                childnode = children.get(segment)
+            if childnode is None:
+                filesystem.raise_on_insecure_file_name(segment)
+                bound = None
+                if node._bound:
+                    bound = node._bound.child(segment)
+                childnode = self.__class__(
+                    name=segment, parent=node, bind=bound)
+            elif node._bound and childnode._bound is None:
+                childnode._set_bound(node._bound.child(segment))
+            node = childnode
+        return node
+
+    def _bound_names(self):
+        """
+        The set of names in the bound directory.  It is cached until
+        the modification time of the bound directory changes.
+        """
+        st = self._bound.stat()
+        key = (st.st_ino, st.st_mtime)
+        if self._listing is not None and self._listing[0] == key:
+            return self._listing[1]
+        names = frozenset(x.name() for x in self._bound)
+        ## a directory changed within the resolution of its mtime
+        ## may change again without changing the mtime, and file
+        ## systems without mtimes keep them at 0
+        if st.st_mtime and time.time() - st.st_mtime > 1:
+            self._listing = (key, names)
+        else:
+            self._listing = None
+        return names
 
+    @_on_node
     def __iter__(self):
-        if self._bound:
-            for x in self._bound:
-                self.child(x.name())
-        return super(path, self).__iter__()
+        if not self._bound:
+            ## skipping the nodes hiding bound files
+            return (x for x in super(path, self).__iter__() if x.exists())
+        return self._merged_iter()
+
+    def _merged_iter(self):
+        ## the entries of the bound directory, but those changed in
+        ## this tree, then the entries only in this tree.  The
+        ## directory is added to the tree to keep the listing cached.
+        self = self._materialize()
+        names = self._bound_names()
+        children = self._children or {}
+        for name in names:
+            node = children.get(name)
+            if node is None:
+                ## not added to the tree, see _materialize
+                yield self.__class__(
+                    name=name, parent=self, bind=self._bound.child(name))
+            elif node.exists():
+                yield node
+        for (name, node) in children.items():
+            if name not in names and node.exists():
+                yield node
 
+    @_on_node
     def rename(self, new_path):
         """
         At least those scenarioes should be covered:
@@ -90,16 +250,16 @@ class path(filesystem.inmem.path):
         """
         if not self._bound and (
             not hasattr(new_path, '_bound') or not new_path._bound):
-            if not _has_common_ancestor(self, new_path):
+            if self.common_ancestor(new_path) is None:
                 raise filesystem.CrossDeviceRenameError()
             return super(path, self).rename(new_path)
 
         if self._bound and hasattr(new_path, '_bound') and new_path._bound:
-            ancestor = _has_common_ancestor(self, new_path)
-            if not ancestor:
+            ancestor = self.common_ancestor(new_path)
+            if ancestor is None:
                 raise filesystem.CrossDeviceRenameError()
-            real_ancestor = _has_common_ancestor(self._bound, new_path._bound)
-            if not real_ancestor:
+            real_ancestor = self._bound.common_ancestor(new_path._bound)
+            if real_ancestor is None:
                 raise filesystem.CrossDeviceRenameError()
             if ancestor._bound <> real_ancestor:
                 raise filesystem.CrossDeviceRenameError()
@@ -111,7 +271,7 @@ class path(filesystem.inmem.path):
             ## probably need to go through all children objects and
             ## rebind.  But first I'll need to create a test to prove
             ## it's broken.
-            self._children = {}
+            self._children = None
             self._bound.rename(new_path._bound)
             return super(path, self).rename(new_path)
 
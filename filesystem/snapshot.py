@@ -0,0 +1,200 @@
+"""
+Snapshots of directory trees, to find out what changed in a tree
+since the last look at it.
+
+A snapshot holds the type, size, modification time and inode number
+of each entry below a directory, by the path name relative to it.
+It works with the path objects of any file system having stat (and
+lstat, if it has symlinks):
+
+    old = filesystem.snapshot.load(index)
+    new = filesystem.snapshot.take(top, previous=old,
+                                   trust_dir_mtimes=True)
+    changes = filesystem.snapshot.diff(old, new)
+    new.save(index)
+
+Snapshots are saved in a compact binary format, see ``Snapshot.save``.
+"""
+from __future__ import with_statement
+import stat
+import struct
+import time
+
+from filesystem._base import _lstat_or_none
+
+## the header: magic and number of entries; each entry is followed by
+## its relative path name, utf-8 encoded
+_MAGIC = 'FSSNAP\x01\n'
+_HEADER = struct.Struct('<8sI')
+_ENTRY = struct.Struct('<cqdQH')
+
+def _type(mode):
+    if stat.S_ISDIR(mode):
+        return 'd'
+    if stat.S_ISREG(mode):
+        return 'f'
+    if stat.S_ISLNK(mode):
+        return 'l'
+    return 'o'
+
+def _entry(st):
+    return (_type(st.st_mode), st.st_size, st.st_mtime, st.st_ino)
+
+def _join(dirname, name):
+    if dirname:
+        return dirname + u'/' + name
+    return name
+
+class Snapshot(object):
+    """
+    The entries of a directory tree.  ``entries`` maps the path
+    names relative to the top (the top itself being ``u''``) to
+    ``(type, size, mtime, inode)`` tuples, where the type is 'd' for
+    directories, 'f' for files, 'l' for symlinks and 'o' for others.
+    """
+    def __init__(self, entries):
+        self.entries = entries
+        self._children = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def children(self, dirname):
+        """
+        Return the names of the entries in the directory ``dirname``.
+        """
+        if self._children is None:
+            children = {}
+            for name in self.entries:
+                if name:
+                    (head, sep, tail) = name.rpartition(u'/')
+                    children.setdefault(head, []).append(tail)
+            self._children = children
+        return self._children.get(dirname, [])
+
+    def save(self, p):
+        """
+        Write the snapshot to the file at the path object ``p``.  The
+        entries are written sorted by their path segments, so the
+        entries below a directory follow it.
+        """
+        names = sorted(self.entries, key=lambda x: x.split(u'/'))
+        with p.open(u'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, len(names)))
+            for name in names:
+                (kind, size, mtime, ino) = self.entries[name]
+                if isinstance(name, unicode):
+                    name = name.encode('utf-8')
+                f.write(_ENTRY.pack(kind, size, mtime, ino, len(name)))
+                f.write(name)
+
+def load(p):
+    """
+    Read a snapshot written by ``Snapshot.save`` from the file at the
+    path object ``p``.  Raises ``ValueError`` if it's no snapshot.
+    """
+    with p.open(u'rb') as f:
+        data = f.read()
+    if len(data) < _HEADER.size:
+        raise ValueError('not a snapshot')
+    (magic, count) = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        raise ValueError('not a snapshot')
+    entries = {}
+    offset = _HEADER.size
+    try:
+        for i in xrange(count):
+            (kind, size, mtime, ino, length) = _ENTRY.unpack_from(
+                data, offset)
+            offset += _ENTRY.size
+            name = data[offset:offset+length].decode('utf-8')
+            offset += length
+            entries[name] = (kind, size, mtime, ino)
+    except struct.error:
+        raise ValueError('snapshot is truncated')
+    return Snapshot(entries)
+
+def take(top, previous=None, trust_dir_mtimes=False):
+    """
+    Take a snapshot of the tree at the path object ``top``.  Each
+    entry is lstat'ed once, symlinks are not followed.
+
+    With ``trust_dir_mtimes`` true, the directories that have the
+    same inode and modification time as in the snapshot
+    ``previous`` are not listed, their entries are taken from it and
+    only the subdirectories are stat'ed, to look into them.  That
+    saves most of the work for trees where few directories change,
+    but files changed in place don't change the modification time of
+    their directory - those changes are not seen.
+    """
+    st = top.stat()
+    entries = {u'': _entry(st)}
+    now = time.time()
+    stack = [(u'', top, entries[u''])]
+    while stack:
+        (dirname, d, entry) = stack.pop()
+        if (trust_dir_mtimes and previous is not None and entry[2] and
+            previous.entries.get(dirname) == entry and
+            now - entry[2] > 1):
+            ## unchanged (and not changed within the resolution of
+            ## the mtime, it might change again without changing it)
+            for name in previous.children(dirname):
+                relname = _join(dirname, name)
+                old = previous.entries[relname]
+                if old[0] == 'd':
+                    c = d.child(name)
+                    cst = _lstat_or_none(c)
+                    if cst is None:
+                        continue
+                    entries[relname] = _entry(cst)
+                    if stat.S_ISDIR(cst.st_mode):
+                        stack.append((relname, c, entries[relname]))
+                else:
+                    entries[relname] = old
+            continue
+        for c in d:
+            cst = _lstat_or_none(c)
+            if cst is None:
+                continue
+            relname = _join(dirname, c.name())
+            entries[relname] = _entry(cst)
+            if stat.S_ISDIR(cst.st_mode):
+                stack.append((relname, c, entries[relname]))
+    return Snapshot(entries)
+
+class Changes(object):
+    """
+    The differences between two snapshots: sets of the relative path
+    names ``added``, ``removed`` and ``modified``.  Entries are
+    modified if their type, size, modification time or inode
+    changed - for directories, only the type counts, their other
+    changes show as changes of the entries in them.
+    """
+    def __init__(self, added, removed, modified):
+        self.added = added
+        self.removed = removed
+        self.modified = modified
+
+    def __nonzero__(self):
+        return bool(self.added or self.removed or self.modified)
+
+    def __repr__(self):
+        return '%s(added=%r, removed=%r, modified=%r)' % (
+            self.__class__.__name__,
+            sorted(self.added), sorted(self.removed), sorted(self.modified))
+
+def diff(old, new):
+    """
+    Return the ``Changes`` from the snapshot ``old`` to ``new``.
+    """
+    (old, new) = (old.entries, new.entries)
+    added = set()
+    modified = set()
+    for (name, entry) in new.iteritems():
+        was = old.get(name)
+        if was is None:
+            added.add(name)
+        elif was != entry and (entry[0] != 'd' or was[0] != 'd'):
+            modified.add(name)
+    removed = set(name for name in old if name not in new)
+    return Changes(added, removed, modified)
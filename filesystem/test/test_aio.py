@@ -0,0 +1,111 @@
+from __future__ import with_statement
+import errno
+import threading
+import time
+
+from nose.tools import eq_ as eq
+
+from filesystem.test.util import (
+    maketemp,
+    assert_raises,
+    )
+
+import filesystem
+import filesystem.aio
+import filesystem.inmem
+import filesystem.multiplexing
+
+class no_executor(object):
+    def submit(self, func, *args, **kwargs):
+        assert False, 'the executor should not be used'
+
+def _inmem():
+    p = filesystem.inmem.path()
+    p.mkdir(create_parents=True, may_exist=True)
+    return filesystem.aio.path(p, no_executor())
+
+def test_inmem_done_right_away():
+    p = _inmem()
+    f = p.child(u'foo').open(u'w')
+    assert f.done()
+    f = f.result()
+    assert f.write('bar').done()
+    f.close()
+    eq(p.child(u'foo').size().result(), 3)
+    eq([x.name() for x in p.iterdir().result()], [u'foo'])
+
+def test_errors():
+    for p in (_inmem(), filesystem.aio.path(filesystem.path(maketemp()))):
+        e = p.child(u'missing').stat().exception(timeout=5)
+        eq(e.errno, errno.ENOENT)
+        e = assert_raises(OSError, p.child(u'missing').stat().result, 5)
+        eq(e.errno, errno.ENOENT)
+
+def test_localfs():
+    tmp = filesystem.path(maketemp())
+    executor = filesystem.aio.Executor(workers=2)
+    p = filesystem.aio.path(tmp, executor)
+    try:
+        p.child(u'dir').mkdir().result(timeout=5)
+        f = p.join(u'dir/foo').open(u'w').result(timeout=5)
+        ## the calls on a file are done in order
+        for i in range(100):
+            f.write('%d\n' % i)
+        f.close().result(timeout=5)
+        eq(tmp.join(u'dir/foo').open().read(),
+           ''.join('%d\n' % i for i in range(100)))
+        eq(p.iterdir().result(timeout=5), [p.child(u'dir')])
+        walk = p.walk().result(timeout=5)
+        eq([(d, subdirs, nondirs) for (d, subdirs, nondirs) in walk],
+           [(p, [p.child(u'dir')], []),
+            (p.child(u'dir'), [], [p.join(u'dir/foo')])])
+        p.join(u'dir/foo').rename(p.child(u'bar')).result(timeout=5)
+        assert tmp.child(u'bar').isfile()
+    finally:
+        executor.shutdown()
+
+def test_bound_multiplexing_blocks():
+    mp_root = filesystem.multiplexing.path()
+    mp_root.mkdir(create_parents=True, may_exist=True)
+    mp_root.child(u'mnt').bind(filesystem.path(maketemp()))
+    assert not filesystem.aio.path(filesystem.inmem.path())._blocking
+    assert filesystem.aio.path(mp_root)._blocking
+    assert filesystem.aio.path(mp_root.join(u'mnt/foo'))._blocking
+
+def test_callbacks():
+    executor = filesystem.aio.Executor(workers=1)
+    try:
+        done = threading.Event()
+        got = []
+        def callback(future):
+            got.append(future.result())
+            done.set()
+        executor.submit(lambda: 42).add_done_callback(callback)
+        done.wait(5)
+        eq(got, [42])
+        ## added after it's done
+        future = executor.submit(lambda: 43)
+        future.result(timeout=5)
+        future.add_done_callback(callback)
+        eq(got, [42, 43])
+    finally:
+        executor.shutdown()
+
+def test_executor_bounded():
+    executor = filesystem.aio.Executor(workers=3)
+    lock = threading.Lock()
+    running = [0, 0]
+    def call():
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+    try:
+        futures = [executor.submit(call) for i in range(20)]
+        for f in futures:
+            f.result(timeout=5)
+        eq(running[1], 3)
+    finally:
+        executor.shutdown()
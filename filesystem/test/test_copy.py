@@ -0,0 +1,54 @@
+from __future__ import with_statement
+import os
+
+from nose.tools import eq_ as eq
+
+from filesystem.test.util import maketemp
+
+import filesystem
+import filesystem.inmem
+import filesystem.multiplexing
+
+def test_localfs_to_localfs():
+    tmp = maketemp()
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    with open(os.path.join(tmp, u'src'), 'wb') as f:
+        f.write(data)
+    src = filesystem.path(tmp).child(u'src')
+    eq(src.copy_to(filesystem.path(tmp).child(u'dest')), len(data))
+    with open(os.path.join(tmp, u'dest'), 'rb') as f:
+        assert f.read() == data
+
+def test_inmem_to_localfs():
+    tmp = maketemp()
+    src = filesystem.inmem.path()
+    src.mkdir(create_parents=True, may_exist=True)
+    with src.child(u'foo').open(u'w') as f:
+        f.write('bar')
+    src.child(u'sub').mkdir()
+    with src.join(u'sub/quux').open(u'w') as f:
+        f.write('thud')
+    eq(src.copytree(filesystem.path(tmp).child(u'copy')), 7)
+    with open(os.path.join(tmp, u'copy', u'sub', u'quux')) as f:
+        eq(f.read(), 'thud')
+
+def test_localfs_to_multiplexing():
+    tmp = maketemp()
+    with open(os.path.join(tmp, u'foo'), 'w') as f:
+        f.write('bar')
+    mp = filesystem.multiplexing.path()
+    mp.mkdir(create_parents=True, may_exist=True)
+    dest = mp.join(u'mnt')
+    filesystem.path(tmp).copytree(dest)
+    with dest.child(u'foo').open() as f:
+        eq(f.read(), 'bar')
+
+def test_symlinked_dirs_are_left_out():
+    tmp = maketemp()
+    os.mkdir(os.path.join(tmp, u'src'))
+    os.mkdir(os.path.join(tmp, u'elsewhere'))
+    os.symlink(os.path.join(tmp, u'elsewhere'),
+               os.path.join(tmp, u'src', u'link'))
+    p = filesystem.path(tmp)
+    p.child(u'src').copytree(p.child(u'dest'))
+    eq(os.listdir(os.path.join(tmp, u'dest')), [])
@@ -1,6 +1,7 @@
 from __future__ import with_statement
 import tempfile
 import os
+import time
 
 from nose.tools import eq_ as eq
 
@@ -34,3 +35,61 @@ def test_not_directory():
     p = filesystem.copyonwrite.path(filesystem.path(temp_dir).join("some_file"))
     # note: the exception is only raised after calling ``next``
     assert_raises(OSError, list, p)
+
+class listing_path(filesystem.path):
+    """
+    localfs path counting the directory listings done.
+    """
+    listings = 0
+
+    def __iter__(self):
+        listing_path.listings += 1
+        return super(listing_path, self).__iter__()
+
+def _make_files(temp_dir, names):
+    for name in names:
+        with open(os.path.join(temp_dir, name), 'w') as f:
+            f.write(name)
+
+def test_iter_adds_no_nodes():
+    temp_dir = maketemp()
+    _make_files(temp_dir, ['file1', 'file2'])
+    p = filesystem.copyonwrite.path(filesystem.path(temp_dir))
+    eq(sorted(x.name() for x in p), ['file1', 'file2'])
+    assert not p._children
+    ## modifying an entry adds it
+    for x in p:
+        if x.name() == 'file1':
+            with x.open('w') as f:
+                f.write('ubba')
+    eq(p._children.keys(), ['file1'])
+    with p.child('file1').open() as f:
+        eq(f.read(), 'ubba')
+    eq(sorted(x.name() for x in p), ['file1', 'file2'])
+
+def test_iter_whiteout():
+    temp_dir = maketemp()
+    _make_files(temp_dir, ['file1', 'file2'])
+    p = filesystem.copyonwrite.path(filesystem.path(temp_dir))
+    p.child('file1').unlink()
+    assert not p.child('file1').exists()
+    eq([x.name() for x in p], ['file2'])
+    assert os.path.exists(os.path.join(temp_dir, 'file1'))
+    with p.child('file1').open('w') as f:
+        f.write('ubba')
+    eq(sorted(x.name() for x in p), ['file1', 'file2'])
+
+def test_iter_cached_until_modified():
+    temp_dir = maketemp()
+    _make_files(temp_dir, ['file1'])
+    ## a recently modified directory is not cached
+    an_hour_ago = time.time() - 3600
+    os.utime(temp_dir, (an_hour_ago, an_hour_ago))
+    p = filesystem.copyonwrite.path(listing_path(temp_dir))
+    listing_path.listings = 0
+    eq([x.name() for x in p], ['file1'])
+    eq([x.name() for x in p], ['file1'])
+    eq(listing_path.listings, 1)
+    _make_files(temp_dir, ['file2'])
+    eq(sorted(x.name() for x in p), ['file1', 'file2'])
+    eq(listing_path.listings, 2)
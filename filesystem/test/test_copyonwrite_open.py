@@ -44,3 +44,106 @@ def test_open_for_writing():
     # since this is the copy_on_write, the write should not be written
     # to the actual file system
     assert_raises(IOError, open, foo)
+
+def test_mmap_for_writing():
+    tmp = maketemp()
+    foo = os.path.join(tmp, u'foo')
+    with open(foo, 'w') as f:
+        f.write('bar')
+    p = filesystem.copyonwrite.path(filesystem.path(foo))
+    with p.mmap('w') as m:
+        eq(m[:], 'bar')
+        m[:] = 'BAR'
+    with p.open() as f:
+        eq(f.read(), 'BAR')
+    ## the real file is untouched
+    with open(foo) as f:
+        eq(f.read(), 'bar')
+
+def _big_file(tmp, blocks):
+    foo = os.path.join(tmp, u'foo')
+    bs = filesystem.copyonwrite.path._block_size
+    data = ''.join([chr(ord('a') + i) * bs for i in range(blocks)])
+    with open(foo, 'w') as f:
+        f.write(data)
+    return (foo, data)
+
+def test_open_for_update():
+    tmp = maketemp()
+    (foo, data) = _big_file(tmp, 4)
+    bs = filesystem.copyonwrite.path._block_size
+    p = filesystem.copyonwrite.path(filesystem.path(foo))
+    with p.open('r+') as f:
+        ## spanning the boundary between the first two blocks
+        f.seek(bs - 2)
+        f.write('XXXX')
+    want = data[:bs - 2] + 'XXXX' + data[bs + 2:]
+    with p.open() as f:
+        eq(f.read(), want)
+    eq(p.size(), len(data))
+    ## only the modified blocks are kept
+    eq(sorted(p._data._blocks.keys()), [0, 1])
+    with open(foo) as f:
+        eq(f.read(), data)
+
+def test_open_for_appending():
+    tmp = maketemp()
+    foo = os.path.join(tmp, u'foo')
+    with open(foo, 'w') as f:
+        f.write('foo\nbar')
+    p = filesystem.copyonwrite.path(filesystem.path(foo))
+    with p.open('a') as f:
+        f.write('\nbaz\n')
+    with p.open() as f:
+        eq(f.readlines(), ['foo\n', 'bar\n', 'baz\n'])
+    with open(foo) as f:
+        eq(f.read(), 'foo\nbar')
+
+def test_truncate_copied_up():
+    tmp = maketemp()
+    (foo, data) = _big_file(tmp, 3)
+    bs = filesystem.copyonwrite.path._block_size
+    p = filesystem.copyonwrite.path(filesystem.path(foo))
+    with p.open('r+') as f:
+        f.seek(bs + 10)
+        f.write('X')
+        f.truncate(bs + 5)
+        f.seek(2 * bs)
+        f.write('Y')
+    with p.open() as f:
+        eq(f.read(), data[:bs + 5] + '\0' * (bs - 5) + 'Y')
+
+class counting_path(filesystem.path):
+    opened = 0
+
+    def open(self, *args, **kwargs):
+        counting_path.opened += 1
+        return super(counting_path, self).open(*args, **kwargs)
+
+def test_readlines_copied_up():
+    tmp = maketemp()
+    foo = os.path.join(tmp, u'foo')
+    lines = ['%d%s\n' % (i, 'x' * (i % 50)) for i in range(10000)]
+    with open(foo, 'w') as f:
+        f.writelines(lines)
+    p = filesystem.copyonwrite.path(counting_path(foo))
+    counting_path.opened = 0
+    with p.open('r+') as f:
+        eq(list(f), lines)
+        ## spanning the boundary between the first two blocks
+        data = ''.join(lines)
+        bs = filesystem.copyonwrite.path._block_size
+        sub = data[bs - 3:bs + 3]
+        eq(f._data.find(sub, bs - 10), data.find(sub, bs - 10))
+        eq(f._data.find('no such line'), -1)
+    ## the bound file was opened once
+    eq(counting_path.opened, 1)
+
+def test_open_directory_for_update():
+    tmp = maketemp()
+    p = filesystem.copyonwrite.path(filesystem.path(tmp))
+    for mode in ('a', 'r+'):
+        e = assert_raises(IOError, p.open, mode)
+        eq(e.errno, errno.EISDIR)
+        assert p.isdir()
+        assert not p.isfile()
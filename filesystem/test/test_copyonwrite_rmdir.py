@@ -14,13 +14,17 @@ import os
 
 import filesystem
 import filesystem.copyonwrite
+import filesystem.inmem
 
 def test_rmdir():
     tmp = maketemp()
     foo = os.path.join(tmp, 'foo')
     os.mkdir(foo)
-    filesystem.copyonwrite.path(filesystem.path(tmp)).child('foo').rmdir()
+    p = filesystem.copyonwrite.path(filesystem.path(tmp))
+    p.child('foo').rmdir()
     assert os.path.exists(foo)
+    assert not p.child('foo').exists()
+    eq(list(p), [])
 
 def test_rmdir_bad_notdir():
     tmp = maketemp()
@@ -41,3 +45,28 @@ def test_rmdir_bad_notfound():
         p.rmdir,
         )
     eq(e.errno, errno.ENOENT)
+
+def test_move_leaves_bound_tree_alone():
+    tmp = maketemp()
+    os.mkdir(os.path.join(tmp, 'foo'))
+    with open(os.path.join(tmp, 'foo', 'bar'), 'w') as f:
+        f.write('bar')
+    dest = filesystem.inmem.path()
+    dest.mkdir(create_parents=True, may_exist=True)
+    p = filesystem.copyonwrite.path(filesystem.path(tmp)).child('foo')
+    p.move(dest.child('foo'))
+    with dest.join('foo/bar').open() as f:
+        eq(f.read(), 'bar')
+    assert os.path.exists(os.path.join(tmp, 'foo', 'bar'))
+
+def test_rmtree():
+    tmp = maketemp()
+    os.mkdir(os.path.join(tmp, 'foo'))
+    with open(os.path.join(tmp, 'foo', 'bar'), 'w') as f:
+        f.write('bar')
+    p = filesystem.copyonwrite.path(filesystem.path(tmp))
+    p.child('foo').rmtree()
+    assert os.path.exists(os.path.join(tmp, 'foo', 'bar'))
+    assert not p.child('foo').exists()
+    assert not p.join('foo/bar').exists()
+    eq(list(p), [])
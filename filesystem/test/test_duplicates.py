@@ -0,0 +1,62 @@
+from __future__ import with_statement
+import os
+
+from nose.tools import eq_ as eq
+
+from filesystem.test.util import (
+    maketemp,
+    assert_raises,
+    )
+
+import filesystem
+import filesystem.inmem
+
+def _inmem():
+    p = filesystem.inmem.path()
+    p.mkdir(create_parents=True, may_exist=True)
+    return p
+
+def _write(p, content):
+    with p.open(u'w') as f:
+        f.write(content)
+
+def test_find_duplicates():
+    p = _inmem()
+    p.child(u'd').mkdir()
+    _write(p.child(u'a'), 'foo')
+    _write(p.join(u'd/b'), 'foo')
+    _write(p.join(u'd/c'), 'bar')
+    _write(p.child(u'e'), '')
+    _write(p.child(u'f'), '')
+    eq(filesystem.find_duplicates(p),
+       [[(p.child(u'a'),), (p.join(u'd/b'),)]])
+
+def test_same_head_and_tail():
+    p = _inmem()
+    head = 'x' * (200 * 1024)
+    _write(p.child(u'a'), head + 'a' + head)
+    _write(p.child(u'b'), head + 'b' + head)
+    _write(p.child(u'c'), head + 'a' + head)
+    eq(filesystem.find_duplicates(p, workers=2),
+       [[(p.child(u'a'),), (p.child(u'c'),)]])
+
+def test_several_roots():
+    p = _inmem()
+    q = _inmem()
+    _write(p.child(u'a'), 'foo')
+    _write(q.child(u'a'), 'foo')
+    eq(filesystem.find_duplicates(p, q), [[(p.child(u'a'),), (q.child(u'a'),)]])
+    ## overlapping roots don't make duplicates
+    eq(filesystem.find_duplicates(p, p), [])
+
+def test_hard_links():
+    tmp = filesystem.path(maketemp())
+    _write(tmp.child(u'a'), 'foo')
+    os.link(tmp.child(u'a')._pathname, tmp.child(u'b')._pathname)
+    eq(filesystem.find_duplicates(tmp), [])
+    _write(tmp.child(u'c'), 'foo')
+    eq(filesystem.find_duplicates(tmp),
+       [[(tmp.child(u'a'), tmp.child(u'b')), (tmp.child(u'c'),)]])
+
+def test_bad_keyword():
+    assert_raises(TypeError, filesystem.find_duplicates, _inmem(), foo=1)
@@ -0,0 +1,130 @@
+from __future__ import with_statement
+
+import errno
+
+from nose.tools import eq_ as eq
+
+from filesystem.test.util import assert_raises
+
+import filesystem.inmem
+
+def _tree():
+    p = filesystem.inmem.path()
+    p.mkdir(create_parents=True, may_exist=True)
+    return p
+
+def test_nodes_have_no_dict():
+    p = _tree()
+    assert not hasattr(p, '__dict__')
+    assert not hasattr(p.child(u'foo'), '__dict__')
+
+def test_no_storage_but_for_files():
+    p = _tree()
+    d = p.child(u'dir')
+    d.mkdir()
+    f = p.child(u'file')
+    with f.open(u'w') as fh:
+        fh.write('foo')
+    for x in (d, f, p.child(u'missing')):
+        eq(x._children, None)
+    eq(d._data, None)
+    eq(p.child(u'missing')._data, None)
+    eq(str(f._data), 'foo')
+
+def test_names_and_stat_fields_shared():
+    p1 = _tree()
+    p2 = _tree()
+    ## only str names, python can't intern unicode
+    name = ''.join(['fo', 'o'])
+    a = p1.child('foo')
+    b = p2.child(name)
+    a.mkdir()
+    b.mkdir()
+    assert a.name() is b.name()
+    assert a._stat is b._stat
+
+def test_lookups_leave_no_nodes():
+    p = _tree()
+    for i in range(100):
+        assert not p.child(u'foo%d' % i).exists()
+    eq(p._children, None)
+    p.child(u'foo').mkdir()
+    p.child(u'foo').child(u'bar').exists()
+    eq(p._children.keys(), [u'foo'])
+    eq(p.child(u'foo')._children, None)
+
+def test_handles_resolve_to_created_node():
+    p = _tree()
+    a = p.child(u'foo')
+    b = p.child(u'foo')
+    a.mkdir()
+    assert b.isdir()
+    with b.child(u'bar').open(u'w') as f:
+        f.write('bar')
+    eq(list(a), [p.child(u'foo', u'bar')])
+    assert a.child(u'bar') is b.child(u'bar')
+
+def test_unlink_removes_node():
+    p = _tree()
+    a = p.child(u'foo')
+    with a.open(u'w') as f:
+        f.write('bar')
+    a.unlink()
+    eq(p._children, {})
+    b = p.child(u'foo')
+    b.mkdir()
+    assert a.isdir()
+
+def test_open_in_missing_directory():
+    p = _tree()
+    e = assert_raises(IOError, p.child(u'foo', u'bar').open, u'w')
+    eq(e.errno, errno.ENOENT)
+    eq(p._children, None)
+
+def test_common_ancestor_of_other_tree():
+    a = _tree().child(u'foo')
+    b = _tree().child(u'foo')
+    eq(a.common_ancestor(b), None)
+    assert not a.is_relative_to(b)
+
+def test_hash_follows_rename():
+    p = _tree()
+    foo = p.join(u'foo/bar')
+    foo.mkdir(create_parents=True)
+    hash(foo)
+    p.child(u'foo').rename(p.child(u'quux'))
+    bar = p.join(u'quux/bar')
+    eq(foo._node(), bar._node())
+    eq(hash(foo._node()), hash(bar))
+    eq(foo._node(), bar)
+
+def test_sort_by_segments():
+    p = _tree()
+    a = p.join(u'a/b')
+    b = p.child(u'a b')
+    c = p.join(u'a/b/c')
+    eq(sorted([c, b, a, p]), [p, a, c, b])
+
+def test_rmtree_drops_subtree():
+    p = _tree()
+    d = p.join(u'foo/bar/baz')
+    d.mkdir(create_parents=True)
+    p.child(u'foo').rmtree()
+    eq(p._children, {})
+    assert not p.join(u'foo/bar/baz').exists()
+
+def test_rmtree_handles_below():
+    p = _tree()
+    d = p.child(u'foo')
+    f = d.join(u'bar/baz')
+    f.parent().mkdir(create_parents=True)
+    f.open(u'w').write('x')
+    assert f.exists()
+    d.rmtree()
+    assert not f.exists()
+    assert not f.parent().exists()
+    ## they're handles for the paths, which can be created again
+    f.parent().mkdir(create_parents=True)
+    f.open(u'w').write('y')
+    eq(p.join(u'foo/bar/baz').open().read(), 'y')
+    eq(f.open().read(), 'y')
@@ -88,6 +88,19 @@ def test_parent_of_relative_subdir():
     p = filesystem.path('foo/bar')
     eq(p.parent(), filesystem.path('foo'))
 
+def test_depth():
+    eq(filesystem.root.depth(), 0)
+    eq(filesystem.path('/foo/bar/').depth(), 2)
+    eq(filesystem.path('.').depth(), 0)
+    eq(filesystem.path('./foo/bar').depth(), 2)
+
+def test_common_ancestor_relative():
+    p = filesystem.path('foo/bar')
+    eq(p.common_ancestor(filesystem.path('foo/baz')), filesystem.path('foo'))
+    eq(p.common_ancestor(filesystem.path('quux')), filesystem.path('.'))
+    eq(p.common_ancestor(filesystem.path('/foo/bar')), None)
+    assert not p.is_relative_to(filesystem.path('/foo'))
+
 def test_name_simple():
     eq(filesystem.path("foo/bar").name(), "bar")
 
@@ -119,3 +132,39 @@ def test_open_for_writing():
     with open(foo) as f:
         got = f.read()
     eq(got, 'bar')
+
+def test_mmap_unaligned_offset():
+    tmp = maketemp()
+    foo = os.path.join(tmp, u'foo')
+    data = ''.join(chr(i % 251) for i in range(3 * 4096 + 100))
+    with open(foo, 'wb') as f:
+        f.write(data)
+    p = filesystem.path(foo)
+    with p.mmap(offset=5000, length=4000) as m:
+        eq(len(m), 4000)
+        eq(m[:], data[5000:9000])
+    with p.mmap(offset=len(data)) as m:
+        eq(len(m), 0)
+
+def test_stat_many_symlinks():
+    tmp = filesystem.path(maketemp())
+    foo = tmp.child(u'foo')
+    foo.mkdir()
+    link = tmp.child(u'link')
+    os.symlink(u'foo', link._pathname)
+    (st,) = filesystem.stat_many([link])
+    eq(st, foo.stat())
+    (st,) = filesystem.stat_many([link], follow_symlinks=False)
+    eq(st, link.lstat())
+
+def test_stat_many_threads():
+    tmp = filesystem.path(maketemp())
+    paths = [tmp.child(u'%d' % i) for i in range(100)]
+    for p in paths[::2]:
+        p.mkdir()
+    got = filesystem.stat_many(paths, workers=8)
+    for (i, st) in enumerate(got):
+        if i % 2:
+            eq(st.errno, errno.ENOENT)
+        else:
+            eq(st, paths[i].stat())
@@ -0,0 +1,68 @@
+from __future__ import with_statement
+import hashlib
+import os
+import time
+
+from nose.tools import eq_ as eq
+
+from filesystem.test.util import maketemp
+
+import filesystem
+
+def _cached_class():
+    class cached_path(filesystem.path):
+        checksum_cache = filesystem.ChecksumCache()
+    return cached_path
+
+def _write(p, content, age=3600):
+    with p.open(u'w') as f:
+        f.write(content)
+    t = time.time() - age
+    os.utime(p._pathname, (t, t))
+
+def test_unchanged_files_not_read_again():
+    tmp = maketemp()
+    cls = _cached_class()
+    p = cls(tmp).child(u'foo')
+    _write(p, 'bar')
+    eq(p.checksum(), hashlib.sha256('bar').hexdigest())
+    eq(p.checksum(), hashlib.sha256('bar').hexdigest())
+    eq(cls.checksum_cache.misses, 1)
+    eq(cls.checksum_cache.hits, 1)
+    ## changed, another mtime
+    _write(p, 'foo', 1800)
+    eq(p.checksum(), hashlib.sha256('foo').hexdigest())
+    eq(cls.checksum_cache.misses, 2)
+
+def test_recent_files_not_cached():
+    tmp = maketemp()
+    cls = _cached_class()
+    p = cls(tmp).child(u'foo')
+    _write(p, 'bar', 0)
+    p.checksum()
+    p.checksum()
+    eq(cls.checksum_cache.hits, 0)
+
+def test_tree_uses_cache():
+    tmp = maketemp()
+    cls = _cached_class()
+    top = cls(tmp)
+    for i in range(10):
+        _write(top.child(u'%d' % i), str(i))
+    first = top.checksum_tree()
+    eq(cls.checksum_cache.misses, 10)
+    eq(top.checksum_tree(), first)
+    eq(cls.checksum_cache.hits, 10)
+
+def test_save_load():
+    tmp = maketemp()
+    cls = _cached_class()
+    p = cls(tmp).child(u'foo')
+    _write(p, 'bar')
+    p.checksum()
+    index = filesystem.path(tmp).child(u'index')
+    cls.checksum_cache.save(index)
+    cls.checksum_cache = filesystem.ChecksumCache.load(index)
+    eq(p.checksum(), hashlib.sha256('bar').hexdigest())
+    eq(cls.checksum_cache.hits, 1)
+    eq(cls.checksum_cache.misses, 0)
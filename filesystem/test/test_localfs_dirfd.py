@@ -0,0 +1,100 @@
+from __future__ import with_statement
+import os
+import shutil
+
+from nose.tools import eq_ as eq
+
+from filesystem.test.util import maketemp
+
+import filesystem
+
+def _dirfd_class(max_fds):
+    class dirfd_path(filesystem.path):
+        dirfd_cache = filesystem.DirFDCache(max_fds=max_fds)
+    return dirfd_path
+
+def test_max_fds():
+    tmp = maketemp()
+    cls = _dirfd_class(2)
+    for name in ('a', 'b', 'c', 'd', 'e'):
+        d = cls(tmp).child(name)
+        d.mkdir()
+        with d.child(u'foo').open(u'w') as f:
+            f.write('bar')
+        assert len(cls.dirfd_cache) <= 2
+    eq(sorted(os.listdir(tmp)), ['a', 'b', 'c', 'd', 'e'])
+    cls.dirfd_cache.close()
+    eq(len(cls.dirfd_cache), 0)
+
+def test_rmdir_forgets():
+    tmp = maketemp()
+    cls = _dirfd_class(4)
+    d = cls(tmp).child(u'a')
+    d.mkdir()
+    d.child(u'foo').mkdir()
+    assert d._pathname in cls.dirfd_cache
+    d.child(u'foo').rmdir()
+    d.rmdir()
+    assert d._pathname not in cls.dirfd_cache
+    ## a new directory with the same name must not be confused with
+    ## the removed one
+    d.mkdir()
+    with d.child(u'foo').open(u'w') as f:
+        f.write('bar')
+    assert os.path.exists(os.path.join(tmp, u'a', u'foo'))
+
+def test_parent_swapped_for_symlink():
+    tmp = maketemp()
+    cls = _dirfd_class(4)
+    d = cls(tmp).child(u'a')
+    d.mkdir()
+    with d.child(u'foo').open(u'w') as f:
+        f.write('bar')
+    ## somebody replaces a with a symlink to somewhere else
+    os.rename(os.path.join(tmp, u'a'), os.path.join(tmp, u'moved'))
+    os.mkdir(os.path.join(tmp, u'evil'))
+    os.symlink(os.path.join(tmp, u'evil'), os.path.join(tmp, u'a'))
+    ## ... but we keep working in the directory we opened
+    with d.child(u'quux').open(u'w') as f:
+        f.write('bar')
+    d.child(u'foo').unlink()
+    eq(os.listdir(os.path.join(tmp, u'moved')), [u'quux'])
+    eq(os.listdir(os.path.join(tmp, u'evil')), [])
+
+def test_removed_outside():
+    tmp = maketemp()
+    cls = _dirfd_class(4)
+    d = cls(tmp).child(u'a')
+    d.mkdir()
+    with d.child(u'foo').open(u'w') as f:
+        f.write('bar')
+    assert d._pathname in cls.dirfd_cache
+    shutil.rmtree(os.path.join(tmp, u'a'))
+    assert not d.exists()
+    os.mkdir(os.path.join(tmp, u'a'))
+    assert d.isdir()
+    with d.child(u'g').open(u'w') as f:
+        f.write('bar')
+    eq(os.listdir(os.path.join(tmp, u'a')), [u'g'])
+
+def test_renamed_and_recreated_outside():
+    tmp = maketemp()
+    cls = _dirfd_class(4)
+    d = cls(tmp).child(u'logs')
+    d.mkdir()
+    with d.child(u'x').open(u'w') as f:
+        f.write('bar')
+    ## rotated behind our back: we stay with the directory we opened,
+    ## and stat and listing agree with open about it
+    os.rename(os.path.join(tmp, u'logs'), os.path.join(tmp, u'logs.1'))
+    os.mkdir(os.path.join(tmp, u'logs'))
+    with d.child(u'y').open(u'w') as f:
+        f.write('bar')
+    assert d.child(u'y').exists()
+    eq(sorted(x.name() for x in d), [u'x', u'y'])
+    eq(sorted(x.name() for x in list(d.walk())[0][2]), [u'x', u'y'])
+    eq(sorted(os.listdir(os.path.join(tmp, u'logs.1'))), [u'x', u'y'])
+    ## until it's forgotten
+    cls.dirfd_cache.forget(d._pathname)
+    assert not d.child(u'y').exists()
+    eq(list(d), [])
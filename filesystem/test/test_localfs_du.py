@@ -0,0 +1,73 @@
+from __future__ import with_statement
+import os
+import time
+
+from nose.tools import eq_ as eq
+
+from filesystem.test.util import maketemp
+
+import filesystem
+
+class counting_path(filesystem.path):
+    """
+    localfs path counting the lstat calls done on it.
+    """
+    calls = 0
+
+    def lstat(self):
+        counting_path.calls += 1
+        return super(counting_path, self).lstat()
+
+def _write(p, content):
+    with p.open(u'w') as f:
+        f.write(content)
+
+def _age(p, seconds=3600):
+    t = time.time() - seconds
+    os.utime(p._pathname, (t, t))
+
+def test_hard_links_counted_once():
+    tmp = filesystem.path(maketemp())
+    d = tmp.child(u'd')
+    d.mkdir()
+    _write(tmp.child(u'foo'), 'bar')
+    os.link(tmp.child(u'foo')._pathname, d.child(u'foo')._pathname)
+    got = tmp.disk_usage()
+    eq(got[tmp], 3)
+    eq(got[d], 0)
+
+def test_symlinks_not_followed():
+    tmp = filesystem.path(maketemp())
+    d = tmp.child(u'd')
+    d.mkdir()
+    _write(d.child(u'foo'), 'x' * 100)
+    os.symlink(u'd', tmp.child(u'link')._pathname)
+    got = tmp.disk_usage()
+    eq(sorted(got.keys()), [tmp, d])
+    eq(got[tmp], 100 + len(u'd'))
+
+def test_incremental():
+    tmp = maketemp()
+    top = counting_path(tmp)
+    for name in (u'a', u'b'):
+        top.child(name).mkdir()
+        for i in range(5):
+            _write(top.child(name, u'%d' % i), 'x')
+        _age(top.child(name))
+    _age(top)
+    cache = {}
+    counting_path.calls = 0
+    eq(top.disk_usage(cache=cache)[top], 10)
+    eq(counting_path.calls, 12)
+    ## nothing changed, only the directories are stat'ed
+    counting_path.calls = 0
+    eq(top.disk_usage(cache=cache)[top], 10)
+    eq(counting_path.calls, 0)
+    ## a new file, only its directory is listed again
+    _write(top.child(u'b', u'new'), 'xx')
+    _age(top.child(u'b'), 1800)
+    counting_path.calls = 0
+    got = top.disk_usage(cache=cache)
+    eq(got[top.child(u'b')], 7)
+    eq(got[top], 12)
+    eq(counting_path.calls, 6)
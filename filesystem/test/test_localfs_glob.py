@@ -0,0 +1,33 @@
+from __future__ import with_statement
+import os
+
+from nose.tools import eq_ as eq
+
+from filesystem.test.util import maketemp
+
+import filesystem
+
+class listing_path(filesystem.path):
+    """
+    localfs path recording the directories listed.
+    """
+    listed = []
+
+    def _walk_children(self):
+        listing_path.listed.append(self.name())
+        return super(listing_path, self)._walk_children()
+
+def test_glob_prunes():
+    tmp = maketemp()
+    for d in ('logs/2025-12/x', 'logs/2026-01/y', 'logs/2026-02', 'src/z'):
+        os.makedirs(os.path.join(tmp, d))
+    for f in ('logs/2025-12/x/a.gz', 'logs/2026-01/y/b.gz',
+              'logs/2026-01/c.txt', 'logs/2026-02/d.gz', 'src/z/e.gz'):
+        with open(os.path.join(tmp, f), 'w') as f:
+            f.write('x')
+    listing_path.listed = []
+    got = sorted(x.name() for x in
+                 listing_path(tmp).glob(u'logs/2026-*/**/*.gz'))
+    eq(got, ['b.gz', 'd.gz'])
+    ## the root and src are never listed, neither is 2025-12
+    eq(sorted(listing_path.listed), ['2026-01', '2026-02', 'logs', 'y'])
@@ -0,0 +1,134 @@
+from __future__ import with_statement
+import errno
+import os
+import resource
+import nose
+
+from nose.tools import eq_ as eq
+
+from filesystem.test.util import (
+    maketemp,
+    assert_raises,
+    )
+
+import filesystem
+import filesystem._localfs
+
+def test_symlinks_not_followed():
+    tmp = maketemp()
+    os.mkdir(os.path.join(tmp, 'keep'))
+    with open(os.path.join(tmp, 'keep', 'foo'), 'w') as f:
+        f.write('bar')
+    os.mkdir(os.path.join(tmp, 'd'))
+    os.symlink(os.path.join(tmp, 'keep'), os.path.join(tmp, 'd', 'link'))
+    filesystem.path(tmp).child(u'd').rmtree()
+    assert not os.path.lexists(os.path.join(tmp, 'd'))
+    assert os.path.exists(os.path.join(tmp, 'keep', 'foo'))
+
+def test_symlink_to_dir():
+    tmp = maketemp()
+    os.mkdir(os.path.join(tmp, 'keep'))
+    os.symlink(os.path.join(tmp, 'keep'), os.path.join(tmp, 'link'))
+    e = assert_raises(OSError, filesystem.path(tmp).child(u'link').rmtree)
+    eq(e.errno, errno.ENOTDIR)
+    assert os.path.isdir(os.path.join(tmp, 'keep'))
+
+def test_wide_and_deep():
+    tmp = filesystem.path(maketemp())
+    top = tmp.child(u'top')
+    top.mkdir()
+    for i in range(20):
+        d = top.child(u'%d' % i)
+        for j in range(10):
+            d = d.child(u'%d' % j)
+        d.mkdir(create_parents=True)
+        for j in range(10):
+            with d.child(u'f%d' % j).open(u'w') as f:
+                f.write('x')
+    top.rmtree(workers=8)
+    assert not top.exists()
+    eq(list(tmp), [])
+
+def test_onerror():
+    tmp = maketemp()
+    os.mkdir(os.path.join(tmp, 'd'))
+    p = filesystem.path(tmp).child(u'd')
+    ## removing the top fails if it's gone in the meantime; the error
+    ## is reported after the rest of the tree is done
+    os.mkdir(os.path.join(tmp, 'd', 'sub'))
+    errors = []
+    real_rmdir = os.rmdir
+    real_rmdirat = filesystem._localfs._rmdirat
+    def rmdir(pathname):
+        if pathname == p._pathname:
+            raise OSError(errno.EBUSY, 'busy', pathname)
+        real_rmdir(pathname)
+    def rmdirat(dirfd, name):
+        if name == u'd':
+            raise OSError(errno.EBUSY, 'busy', name)
+        real_rmdirat(dirfd, name)
+    os.rmdir = rmdir
+    filesystem._localfs._rmdirat = rmdirat
+    try:
+        p.rmtree(onerror=errors.append)
+        e = assert_raises(OSError, p.rmtree)
+    finally:
+        os.rmdir = real_rmdir
+        filesystem._localfs._rmdirat = real_rmdirat
+    eq([x.errno for x in errors], [errno.EBUSY])
+    eq(e.errno, errno.EBUSY)
+    assert not os.path.exists(os.path.join(tmp, 'd', 'sub'))
+
+def test_generic():
+    tmp = maketemp()
+    os.makedirs(os.path.join(tmp, 'd', 'sub'))
+    os.mkdir(os.path.join(tmp, 'keep'))
+    with open(os.path.join(tmp, 'd', 'sub', 'foo'), 'w') as f:
+        f.write('bar')
+    os.symlink(os.path.join(tmp, 'keep'), os.path.join(tmp, 'd', 'link'))
+    filesystem.WalkMixin.rmtree(filesystem.path(tmp).child(u'd'))
+    eq(os.listdir(tmp), ['keep'])
+
+def test_replaced_directory():
+    if not filesystem._localfs._libc.available:
+        raise nose.SkipTest('no openat on this platform')
+    tmp = maketemp()
+    os.makedirs(os.path.join(tmp, 'd', 'sub'))
+    os.mkdir(os.path.join(tmp, 'other'))
+    ## as if d was listed while it was still the other directory
+    errors = filesystem._localfs._TreeRemover(2).run(
+        os.path.join(tmp, u'd'), os.lstat(os.path.join(tmp, 'other')))
+    eq([e.errno for e in errors], [errno.EAGAIN])
+    assert os.path.isdir(os.path.join(tmp, 'd', 'sub'))
+    assert os.path.isdir(os.path.join(tmp, 'other'))
+
+def test_wide_tree_few_fds():
+    if not os.path.isdir('/proc/self/fd'):
+        raise nose.SkipTest('no /proc/self/fd to count descriptors')
+    tmp = filesystem.path(maketemp())
+    top = tmp.child(u'top')
+    for i in range(1500):
+        top.join(u'%d/sub' % i).mkdir(create_parents=True)
+    ## fewer descriptors than there are directories at a level
+    used = len(os.listdir('/proc/self/fd'))
+    limits = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (used + 200, limits[1]))
+    try:
+        top.rmtree(workers=4)
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, limits)
+    assert not top.exists()
+
+def test_relative_and_trailing_slash():
+    tmp = maketemp()
+    os.makedirs(os.path.join(tmp, 'rel', 'sub'))
+    cwd = os.getcwd()
+    os.chdir(tmp)
+    try:
+        filesystem.path(u'rel').rmtree()
+    finally:
+        os.chdir(cwd)
+    assert not os.path.exists(os.path.join(tmp, 'rel'))
+    os.makedirs(os.path.join(tmp, 'slash', 'sub'))
+    filesystem.path(os.path.join(tmp, u'slash') + u'/').rmtree()
+    assert not os.path.exists(os.path.join(tmp, 'slash'))
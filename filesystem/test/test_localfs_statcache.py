@@ -0,0 +1,83 @@
+from __future__ import with_statement
+import os
+
+from nose.tools import eq_ as eq
+
+from filesystem.test.util import maketemp
+
+import filesystem
+
+def _cached_class(ttl=None):
+    class cached_path(filesystem.path):
+        stat_cache = filesystem.StatCache(ttl=ttl)
+    return cached_path
+
+def test_wrappers_share_one_stat():
+    tmp = maketemp()
+    cls = _cached_class()
+    p = cls(tmp).child(u'foo')
+    with p.open(u'w') as f:
+        f.write('bar')
+    assert p.exists() and p.isfile()
+    eq(p.size(), 3)
+    eq(cls.stat_cache.misses, 1)
+    eq(cls.stat_cache.hits, 2)
+
+def test_shared_between_path_objects():
+    tmp = maketemp()
+    cls = _cached_class()
+    cls(tmp).stat()
+    cls(tmp).stat()
+    eq(cls.stat_cache.misses, 1)
+    eq(cls.stat_cache.hits, 1)
+
+def test_ttl():
+    tmp = maketemp()
+    cls = _cached_class(ttl=0)
+    p = cls(tmp)
+    p.stat()
+    p.stat()
+    eq(cls.stat_cache.misses, 2)
+    eq(cls.stat_cache.hits, 0)
+
+def test_refresh():
+    tmp = maketemp()
+    cls = _cached_class()
+    p = cls(tmp).child(u'foo')
+    with p.open(u'w') as f:
+        f.write('bar')
+    eq(p.size(), 3)
+    ## modified behind our back, the cache can't know
+    with open(os.path.join(tmp, u'foo'), 'a') as f:
+        f.write('foo')
+    eq(p.size(), 3)
+    p.refresh()
+    eq(p.size(), 6)
+
+def test_invalidated_by_mutations():
+    tmp = maketemp()
+    cls = _cached_class()
+    p = cls(tmp).child(u'foo')
+    assert not p.exists()
+    p.mkdir()
+    assert p.isdir()
+    p.rmdir()
+    assert not p.exists()
+    with p.open(u'w') as f:
+        f.write('bar')
+    assert p.isfile()
+    q = cls(tmp).child(u'quux')
+    assert not q.exists()
+    p.rename(q)
+    assert q.isfile()
+    assert not cls(tmp).child(u'foo').exists()
+    q.unlink()
+    assert not q.exists()
+
+def test_errors_are_not_cached():
+    tmp = maketemp()
+    cls = _cached_class()
+    p = cls(tmp).child(u'foo')
+    assert not p.exists()
+    os.mkdir(os.path.join(tmp, u'foo'))
+    assert p.exists()
@@ -0,0 +1,199 @@
+from __future__ import with_statement
+import os
+import shutil
+import stat
+import sys
+
+from nose.tools import eq_ as eq
+
+from filesystem.test.util import maketemp, assert_raises
+
+import filesystem
+import filesystem._localfs
+
+class counting_path(filesystem.path):
+    """
+    localfs path counting the stat and lstat calls done on it.
+    """
+    calls = 0
+
+    def stat(self):
+        counting_path.calls += 1
+        return super(counting_path, self).stat()
+
+    def lstat(self):
+        counting_path.calls += 1
+        return super(counting_path, self).lstat()
+
+def _make_tree(tmp):
+    for d in ('a', 'a/b', 'c'):
+        os.mkdir(os.path.join(tmp, d))
+    for f in ('f1', 'a/f2', 'a/b/f3', 'c/f4'):
+        with open(os.path.join(tmp, f), 'w') as f:
+            f.write('x')
+    ## 3 directories and 4 files
+    return 7
+
+def test_walk_stats_each_entry_at_most_once():
+    tmp = maketemp()
+    entries = _make_tree(tmp)
+    counting_path.calls = 0
+    got = list(counting_path(tmp).walk())
+    eq(len(got), 4)
+    assert counting_path.calls <= entries, \
+        '%d stat calls for %d entries' % (counting_path.calls, entries)
+
+def test_walk_does_not_follow_symlinked_dirs():
+    tmp = maketemp()
+    _make_tree(tmp)
+    os.symlink(os.path.join(tmp, 'a'), os.path.join(tmp, 'link'))
+    p = filesystem.path(tmp)
+    got = list(p.walk())
+    eq(len(got), 4)
+    eq(sorted(x.name() for x in got[0][1]), ['a', 'c', 'link'])
+
+def test_walk_dangling_symlink():
+    tmp = maketemp()
+    os.symlink(os.path.join(tmp, 'nowhere'), os.path.join(tmp, 'link'))
+    got = list(filesystem.path(tmp).walk())
+    eq(len(got), 1)
+    eq(got[0][1], [])
+    eq([x.name() for x in got[0][2]], ['link'])
+
+def test_walk_deep_tree():
+    tmp = maketemp()
+    ## deeper than a recursive walk could go
+    depth = sys.getrecursionlimit() + 100
+    ## os.makedirs recurses, and the whole path name may be too long
+    ## for the os, so we build the tree one level at a time
+    cwd = os.getcwd()
+    try:
+        os.chdir(tmp)
+        for i in range(depth):
+            os.mkdir('d')
+            os.chdir('d')
+    finally:
+        os.chdir(cwd)
+    p = filesystem.path(tmp)
+    got = list(p.walk())
+    eq(len(got), depth + 1)
+    eq(got[-1][0], p.join('/'.join(['d'] * depth)))
+    got = list(p.walk(topdown=False))
+    eq(len(got), depth + 1)
+    eq(got[-1][0], p)
+    eq(got[0][0], p.join('/'.join(['d'] * depth)))
+    ## clean up, the recursive shutil.rmtree in maketemp can't
+    for (d, subdirs, nondirs) in got[:-1]:
+        d.rmdir()
+
+class fake_entry(object):
+    ## what walk uses of the entries scandir returns
+    def __init__(self, dirname, name):
+        self.name = name
+        self._pathname = os.path.join(dirname, name)
+        self._mode = os.lstat(self._pathname).st_mode
+
+    def is_dir(self, follow_symlinks=True):
+        if follow_symlinks and self.is_symlink():
+            return os.path.isdir(self._pathname)
+        return stat.S_ISDIR(self._mode)
+
+    def is_file(self):
+        if self.is_symlink():
+            return os.path.isfile(self._pathname)
+        return stat.S_ISREG(self._mode)
+
+    def is_symlink(self):
+        return stat.S_ISLNK(self._mode)
+
+def fake_scandir(dirname):
+    return [fake_entry(dirname, name) for name in os.listdir(dirname)]
+
+def _cached_class():
+    class cached_path(filesystem.path):
+        stat_cache = filesystem.StatCache()
+    return cached_path
+
+def _check_types_kept(tmp):
+    cls = _cached_class()
+    got = list(cls(tmp).walk())
+    eq(len(got), 4)
+    misses = cls.stat_cache.misses
+    found = {}
+    for (d, subdirs, nondirs) in got:
+        for c in subdirs + nondirs:
+            found[c.name()] = (c.exists(), c.isdir(), c.isfile(), c.islink())
+    eq(cls.stat_cache.misses, misses)
+    eq(found[u'a'], (True, True, False, False))
+    eq(found[u'f1'], (True, False, True, False))
+    eq(found[u'link'], (True, True, False, True))
+    ## until they're refreshed
+    c = got[0][1][0]
+    c.refresh()
+    assert c.isdir()
+    eq(cls.stat_cache.misses, misses + 1)
+
+def test_walk_children_keep_types():
+    tmp = maketemp()
+    _make_tree(tmp)
+    os.symlink(os.path.join(tmp, 'a'), os.path.join(tmp, 'link'))
+    _check_types_kept(tmp)
+
+def test_walk_scandir():
+    tmp = maketemp()
+    _make_tree(tmp)
+    os.symlink(os.path.join(tmp, 'a'), os.path.join(tmp, 'link'))
+    real_scandir = filesystem._localfs.scandir
+    filesystem._localfs.scandir = fake_scandir
+    try:
+        counting_path.calls = 0
+        got = list(counting_path(tmp).walk())
+        ## nothing stat'ed, the types are in the listing
+        eq(counting_path.calls, 0)
+        eq(sorted(x.name() for x in got[0][1]), [u'a', u'c', u'link'])
+        _check_types_kept(tmp)
+    finally:
+        filesystem._localfs.scandir = real_scandir
+
+def test_walk_types_not_kept_without_cache():
+    tmp = maketemp()
+    _make_tree(tmp)
+    got = list(filesystem.path(tmp).walk())
+    (a,) = [c for c in got[0][1] if c.name() == u'a']
+    (f1,) = [c for c in got[0][2] if c.name() == u'f1']
+    ## replaced behind our back
+    shutil.rmtree(os.path.join(tmp, 'a'))
+    os.rename(os.path.join(tmp, 'f1'), os.path.join(tmp, 'a'))
+    assert not f1.exists()
+    assert a.isfile()
+    assert not a.isdir()
+
+def test_walk_types_after_rename():
+    tmp = maketemp()
+    _make_tree(tmp)
+    cls = _cached_class()
+    got = list(cls(tmp).walk())
+    (f1,) = [c for c in got[0][2] if c.name() == u'f1']
+    assert f1.isfile()
+    os.unlink(os.path.join(tmp, 'f1'))
+    cls(tmp).child(u'c').rename(cls(tmp).child(u'f1'))
+    assert f1.isdir()
+    assert not f1.isfile()
+
+def test_walk_types_dropped_by_failing_stat():
+    tmp = maketemp()
+    _make_tree(tmp)
+    cls = _cached_class()
+    real_scandir = filesystem._localfs.scandir
+    filesystem._localfs.scandir = fake_scandir
+    try:
+        got = list(cls(tmp).walk())
+    finally:
+        filesystem._localfs.scandir = real_scandir
+    (a,) = [c for c in got[0][1] if c.name() == u'a']
+    assert a.isdir()
+    shutil.rmtree(os.path.join(tmp, 'a'))
+    ## only the types from the listing were cached
+    assert_raises(OSError, a.stat)
+    assert not a.exists()
+    assert_raises(OSError, a.isdir)
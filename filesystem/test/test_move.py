@@ -0,0 +1,143 @@
+from __future__ import with_statement
+import os
+
+from nose.tools import eq_ as eq
+
+from filesystem.test.util import maketemp, assert_raises
+
+import filesystem
+import filesystem.inmem
+import filesystem.multiplexing
+
+def _inmem_tree():
+    p = filesystem.inmem.path()
+    p.mkdir(create_parents=True, may_exist=True)
+    p.join(u'src/sub').mkdir(create_parents=True)
+    for name in (u'src/a', u'src/b', u'src/sub/c'):
+        with p.join(name).open(u'w') as f:
+            f.write(name.encode('utf-8'))
+    return p
+
+def test_move_renames_if_possible():
+    p = _inmem_tree()
+    src = p.child(u'src')
+    stats = src.move(p.child(u'dest'))
+    eq(stats.bytes, 0)
+    eq(src, p.child(u'dest'))
+    assert not p.child(u'src').exists()
+    assert p.join(u'dest/sub/c').isfile()
+
+def test_move_across_file_systems():
+    tmp = maketemp()
+    p = _inmem_tree()
+    stats = p.child(u'src').move(filesystem.path(tmp).child(u'dest'),
+                                 workers=2)
+    eq(stats.bytes, len('src/a') + len('src/b') + len('src/sub/c'))
+    assert stats.seconds is not None
+    assert not p.child(u'src').exists()
+    with open(os.path.join(tmp, u'dest', u'sub', u'c')) as f:
+        eq(f.read(), 'src/sub/c')
+
+def test_move_file_across_file_systems():
+    tmp = maketemp()
+    p = _inmem_tree()
+    p.join(u'src/a').move(filesystem.path(tmp).child(u'a'))
+    assert not p.join(u'src/a').exists()
+    with open(os.path.join(tmp, u'a')) as f:
+        eq(f.read(), 'src/a')
+
+class crashing_path(filesystem.path):
+    """
+    localfs path failing to be written to if its name is ``crash``.
+    """
+    crash = None
+
+    def open(self, mode='r', *args, **kwargs):
+        if 'w' in mode and self.name() == crashing_path.crash:
+            raise IOError('simulated crash')
+        return super(crashing_path, self).open(mode, *args, **kwargs)
+
+def test_move_resumes_from_manifest():
+    tmp = maketemp()
+    p = _inmem_tree()
+    manifest = p.child(u'manifest')
+    dest = crashing_path(tmp).child(u'dest')
+    crashing_path.crash = u'c'
+    assert_raises(IOError, p.child(u'src').move, dest, 1, manifest)
+    ## the source is still complete
+    assert p.join(u'src/sub/c').exists()
+    with manifest.open() as f:
+        eq(sorted(f.read().split()), ['a', 'b'])
+    ## the files already copied are not copied again
+    os.unlink(os.path.join(tmp, u'dest', u'a'))
+    crashing_path.crash = None
+    stats = p.child(u'src').move(dest, 1, manifest)
+    eq(stats.bytes, len('src/sub/c'))
+    assert not manifest.exists()
+    assert not p.child(u'src').exists()
+    eq(sorted(os.listdir(os.path.join(tmp, u'dest'))), [u'b', u'sub'])
+
+def _local_tree():
+    tmp = maketemp()
+    os.makedirs(os.path.join(tmp, 'src', 'sub'))
+    for name in ('src/a', 'src/sub/c'):
+        with open(os.path.join(tmp, name), 'w') as f:
+            f.write(name)
+    return filesystem.path(tmp)
+
+def test_move_local_to_inmem():
+    src = _local_tree().child(u'src')
+    dest = filesystem.inmem.path()
+    dest.mkdir(create_parents=True, may_exist=True)
+    stats = src.move(dest.child(u'tree'))
+    eq(stats.bytes, len('src/a') + len('src/sub/c'))
+    assert not src.exists()
+    with dest.join(u'tree/sub/c').open() as f:
+        eq(f.read(), 'src/sub/c')
+
+def test_move_local_file_to_multiplexing():
+    tmp = _local_tree()
+    dest = filesystem.multiplexing.path()
+    dest.mkdir(create_parents=True, may_exist=True)
+    tmp.join(u'src/a').move(dest.child(u'a'))
+    assert not tmp.join(u'src/a').exists()
+    with dest.child(u'a').open() as f:
+        eq(f.read(), 'src/a')
+
+def test_rename_local_to_inmem():
+    tmp = _local_tree()
+    dest = filesystem.inmem.path()
+    assert_raises(filesystem.CrossDeviceRenameError,
+                  tmp.join(u'src/a').rename, dest.child(u'a'))
+
+class other_device_path(filesystem.path):
+    """
+    localfs path on another device, as far as rename knows.
+    """
+    def rename(self, new_path):
+        raise filesystem.CrossDeviceRenameError()
+
+def test_move_symlinked_dir():
+    tmp = _local_tree()
+    os.mkdir(os.path.join(str(tmp), 'elsewhere'))
+    os.symlink(u'../../elsewhere', os.path.join(str(tmp), 'src', 'sub', 'link'))
+    src = other_device_path(str(tmp)).child(u'src')
+    src.move(tmp.child(u'dest'))
+    assert not src.exists()
+    eq(os.readlink(os.path.join(str(tmp), 'dest', 'sub', 'link')),
+       '../../elsewhere')
+    with open(os.path.join(str(tmp), 'dest', 'sub', 'c')) as f:
+        eq(f.read(), 'src/sub/c')
+    assert os.path.isdir(os.path.join(str(tmp), 'elsewhere'))
+
+def test_move_symlinked_dir_refused():
+    tmp = _local_tree()
+    os.symlink(os.path.join(str(tmp), 'src', 'sub'),
+               os.path.join(str(tmp), 'src', 'link'))
+    dest = filesystem.inmem.path()
+    dest.mkdir(create_parents=True, may_exist=True)
+    src = tmp.child(u'src')
+    assert_raises(OSError, src.move, dest.child(u'tree'))
+    ## nothing copied, nothing removed
+    assert not dest.child(u'tree').exists()
+    eq(sorted(os.listdir(os.path.join(str(tmp), 'src'))), ['a', 'link', 'sub'])
@@ -1,3 +1,5 @@
+import errno
+
 import filesystem.multiplexing 
 import filesystem
 
@@ -58,3 +60,71 @@ def test_bind():
     ne(real_foo, foo2)
     
     
+
+def test_bind_switches_dispatch():
+    mp_root = filesystem.multiplexing.path()
+    mp_root.mkdir(create_parents=True, may_exist=True)
+    mountpoint = mp_root.child('mnt')
+    real_path = filesystem.path(maketemp())
+    mountpoint.bind(real_path)
+    assert isinstance(mountpoint, filesystem.multiplexing.path)
+    eq(type(mountpoint).__name__, 'path')
+    ## delegated, also attributes only the bound path has
+    eq(mountpoint.stat(), real_path.stat())
+    eq(mountpoint.readlink, real_path.readlink)
+    ## not delegated
+    eq(mountpoint.name(), 'mnt')
+    ## children are bound too
+    assert isinstance(mountpoint.child('foo')._bound, filesystem.path)
+    mountpoint.unbind()
+    assert type(mountpoint) is filesystem.multiplexing.path
+    assert not mountpoint.exists()
+    assert not hasattr(mountpoint, 'readlink')
+
+def test_lookup_in_mount_adds_no_nodes():
+    mp_root = filesystem.multiplexing.path()
+    mp_root.mkdir(create_parents=True, may_exist=True)
+    real_pathname = maketemp()
+    mountpoint = mp_root.join('mnt/tmp')
+    mountpoint.bind(filesystem.path(real_pathname))
+    p = mp_root.join('mnt/tmp/a/b/c')
+    eq(p._bound, filesystem.path(real_pathname).join('a/b/c'))
+    eq(p.parent().parent().parent(), mountpoint)
+    assert not p.exists()
+    eq(mountpoint._children, None)
+    ## binding a path inside the mount adds it
+    other = filesystem.path(real_pathname).child('other')
+    other.mkdir()
+    p.bind(other)
+    assert mp_root.join('mnt/tmp/a/b/c') is p
+    assert p.isdir()
+
+def test_many_mounts():
+    mp_root = filesystem.multiplexing.path()
+    mp_root.mkdir(create_parents=True, may_exist=True)
+    tmp = filesystem.path(maketemp())
+    real = []
+    for i in range(20):
+        real.append(tmp.child(str(i)))
+        real[-1].mkdir()
+        mp_root.join('mnt/%d' % i).bind(real[-1])
+    for i in range(20):
+        eq(mp_root.join('mnt/%d/foo/bar' % i)._bound,
+           real[i].join('foo/bar'))
+
+def test_stat_many_goes_to_bound():
+    mp_root = filesystem.multiplexing.path()
+    mp_root.mkdir(create_parents=True, may_exist=True)
+    tmp = filesystem.path(maketemp())
+    with tmp.child('foo').open('w') as f:
+        f.write('bar')
+    mp_root.join('mnt/tmp').bind(tmp)
+    mp_root.child('here').mkdir()
+    got = filesystem.stat_many([
+            mp_root.join('mnt/tmp/foo'),
+            mp_root.child('here'),
+            mp_root.join('mnt/tmp/missing'),
+            ])
+    eq(got[0], tmp.child('foo').stat())
+    eq(got[1], mp_root.child('here').stat())
+    eq(got[2].errno, errno.ENOENT)
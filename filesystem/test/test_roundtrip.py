@@ -21,6 +21,7 @@ from filesystem.test.util import (
 import filesystem
 
 import errno
+import hashlib
 import stat
 import time
 import os
@@ -227,6 +228,32 @@ class OperationsMixin(object):
             got = f.read()
             eq(got, 'foobar')
 
+    def test_positions_independent(self):
+        p = self._create_file(u'foo', 'foo\nbar\n')
+        with p.open() as f1:
+            with p.open() as f2:
+                eq(f1.readline(), 'foo\n')
+                eq(f2.read(2), 'fo')
+                eq(f1.tell(), 4)
+                eq(f1.read(), 'bar\n')
+                eq(f2.read(), 'o\nbar\n')
+
+    def test_readinto(self):
+        p = self._create_file(u'foo', 'foobar')
+        buf = bytearray(4)
+        with p.open() as f:
+            eq(f.readinto(buf), 4)
+            eq(str(buf), 'foob')
+            eq(f.readinto(memoryview(buf)[1:]), 2)
+            eq(str(buf), 'farb')
+            eq(f.readinto(buf), 0)
+
+    def test_open_directory(self):
+        p = self.path.child(u'foo')
+        p.mkdir()
+        e = assert_raises(IOError, p.open)
+        eq(e.errno, errno.EISDIR)
+
     def test_overwrite(self):
         """
         Tests that appending to an existing file works
@@ -335,6 +362,102 @@ class OperationsMixin(object):
         c = p.child(u'bar')
         eq(c.parent(), p)
 
+    def test_depth(self):
+        p = self.path.join(u'foo/bar')
+        eq(p.depth(), self.path.depth() + 2)
+        eq(p.parent().depth(), self.path.depth() + 1)
+
+    def test_is_relative_to(self):
+        p = self.path.join(u'foo/bar')
+        assert p.is_relative_to(self.path)
+        assert p.is_relative_to(self.path.child(u'foo'))
+        assert p.is_relative_to(p)
+        assert not self.path.is_relative_to(p)
+        assert not p.is_relative_to(self.path.child(u'fo'))
+        assert not p.is_relative_to(u'foo')
+
+    def test_common_ancestor(self):
+        a = self.path.join(u'foo/bar/baz')
+        b = self.path.join(u'foo/quux')
+        eq(a.common_ancestor(b), self.path.child(u'foo'))
+        eq(b.common_ancestor(a), self.path.child(u'foo'))
+        eq(a.common_ancestor(self.path), self.path)
+        eq(a.common_ancestor(a), a)
+        eq(a.common_ancestor(u'foo'), None)
+
+    def test_hash(self):
+        a = self.path.join(u'foo/bar')
+        b = self.path.child(u'foo').child(u'bar')
+        eq(hash(a), hash(b))
+        eq(len(set([a, b, a.parent(), self.path.child(u'foo')])), 2)
+        d = {a: 1}
+        eq(d[b], 1)
+        assert self.path.child(u'foo') not in d
+
+    def test_sort(self):
+        names = [u'foo/bar', u'foo', u'bar', u'foo/a', u'foo/bar/baz']
+        got = sorted(self.path.join(x) for x in names)
+        eq(got, [self.path.join(x) for x in sorted(names)])
+
+    def test_stat_many(self):
+        foo = self._create_file(u'foo', 'barfoo')
+        missing = self.path.child(u'missing')
+        got = filesystem.stat_many([foo, missing, self.path, foo])
+        eq(len(got), 4)
+        eq(got[0].st_size, 6)
+        assert isinstance(got[1], OSError)
+        eq(got[1].errno, errno.ENOENT)
+        assert stat.S_ISDIR(got[2].st_mode)
+        eq(got[3].st_size, 6)
+
+    def test_disk_usage(self):
+        self._create_file(u'foo', 'bar')
+        d = self.path.child(u'dir')
+        sub = d.child(u'sub')
+        sub.mkdir(create_parents=True)
+        with d.child(u'bar').open(u'w') as f:
+            f.write('barfo')
+        with sub.child(u'baz').open(u'w') as f:
+            f.write('bazquux')
+        got = self.path.disk_usage()
+        eq(got, {self.path: 15, d: 12, sub: 7})
+        eq(self.path.disk_usage(recursive=False), {self.path: 3})
+
+    def test_checksum(self):
+        p = self._create_file(u'foo', 'barfoo')
+        eq(p.checksum(), hashlib.sha256('barfoo').hexdigest())
+        eq(p.checksum('md5'), hashlib.md5('barfoo').hexdigest())
+
+    def test_checksum_tree(self):
+        foo = self._create_file(u'foo', 'bar')
+        d = self.path.child(u'dir')
+        d.mkdir()
+        with d.child(u'bar').open(u'w') as f:
+            f.write('barfoo')
+        got = self.path.checksum_tree(workers=2)
+        eq(got, {foo: hashlib.sha256('bar').hexdigest(),
+                 d.child(u'bar'): hashlib.sha256('barfoo').hexdigest()})
+
+    def test_rmtree(self):
+        d = self.path.child(u'dir')
+        d.join(u'sub/subsub').mkdir(create_parents=True)
+        d.child(u'other').mkdir()
+        for name in (u'foo', u'sub/foo', u'sub/subsub/foo', u'other/foo'):
+            with d.join(name).open(u'w') as f:
+                f.write('bar')
+        d.rmtree(workers=2)
+        assert not d.exists()
+        assert not d.join(u'sub/foo').exists()
+        eq(list(self.path), [])
+
+    def test_rmtree_bad(self):
+        e = assert_raises(OSError, self.path.child(u'missing').rmtree)
+        eq(e.errno, errno.ENOENT)
+        foo = self._create_file(u'foo', 'bar')
+        e = assert_raises(OSError, foo.rmtree)
+        eq(e.errno, errno.ENOTDIR)
+        assert foo.exists()
+
     def test_rename_simple(self):
         a = self.path.child(u'foo')
         with a.open(u'w') as f:
@@ -570,6 +693,155 @@ class OperationsMixin(object):
         ## further above - and it should be refactored to avoid
         ## duplicated code.
 
+    def test_walk_onerror(self):
+        missing = self.path.child(u'missing')
+        assert_raises(OSError, list, missing.walk())
+        for topdown in (True, False):
+            errors = []
+            eq(list(missing.walk(topdown=topdown, onerror=errors.append)),
+               [])
+            eq(len(errors), 1)
+            eq(errors[0].errno, errno.ENOENT)
+        errors = []
+        eq(list(missing.parallel_walk(onerror=errors.append)), [])
+        eq(len(errors), 1)
+
+    def _make_walk_tree(self):
+        for d in (u'a/b/c', u'a/d', u'e'):
+            self.path.join(d).mkdir(create_parents=True)
+        for f in (u'f1', u'a/f2', u'a/b/c/f3', u'e/f4'):
+            with self.path.join(f).open(u'w') as f:
+                f.write('x')
+
+    def _walk_names(self, walker):
+        return [(unicode(d), sorted(x.name() for x in subdirs),
+                 sorted(x.name() for x in nondirs))
+                for (d, subdirs, nondirs) in walker]
+
+    def _relname(self, p):
+        names = []
+        while p != self.path:
+            names.append(p.name())
+            p = p.parent()
+        names.reverse()
+        return u'/'.join(names)
+
+    def _glob_names(self, found):
+        return sorted(self._relname(x) for x in found)
+
+    def test_glob(self):
+        self._make_walk_tree()
+        eq(self._glob_names(self.path.glob(u'*')), [u'a', u'e', u'f1'])
+        eq(self._glob_names(self.path.glob(u'a/f?')), [u'a/f2'])
+        eq(self._glob_names(self.path.glob(u'*/f*')), [u'a/f2', u'e/f4'])
+        eq(self._glob_names(self.path.glob(u'a/b')), [u'a/b'])
+        eq(self._glob_names(self.path.glob(u'a/x')), [])
+        eq(self._glob_names(self.path.glob(u'f1/x')), [])
+        eq(self._glob_names(self.path.glob(u'f1/*')), [])
+        eq(self._glob_names(self.path.glob(u'**/f[0-9]')),
+           [u'a/b/c/f3', u'a/f2', u'e/f4', u'f1'])
+        eq(self._glob_names(self.path.glob(u'a/**')),
+           [u'a', u'a/b', u'a/b/c', u'a/d'])
+        eq(self._glob_names(self.path.glob(u'a/**/c/*')), [u'a/b/c/f3'])
+        eq(self._glob_names(self.path.glob(u'**/**/f3')), [u'a/b/c/f3'])
+        eq(self._glob_names(self.path.rglob(u'f*')),
+           [u'a/b/c/f3', u'a/f2', u'e/f4', u'f1'])
+        assert_raises(filesystem.InsecurePathError, self.path.glob, u'../*')
+        assert_raises(filesystem.InsecurePathError, self.path.glob, u'/*')
+
+    def test_copy_to(self):
+        src = self._create_file(u'foo', 'bar' * 1000)
+        dest = self.path.child(u'quux')
+        eq(src.copy_to(dest), 3000)
+        with self.path.child(u'quux').open() as f:
+            eq(f.read(), 'bar' * 1000)
+        ## overwrites
+        self._create_file(u'foo', 'foo')
+        eq(src.copy_to(dest), 3)
+        with self.path.child(u'quux').open() as f:
+            eq(f.read(), 'foo')
+
+    def test_copytree(self):
+        self._make_walk_tree()
+        self.path.child(u'copy').mkdir()
+        self.path.child(u'a').copytree(self.path.join(u'copy/a'), workers=2)
+        eq(self._walk_names(self.path.join(u'copy/a').walk())[1:],
+           [(unicode(self.path.join(u'copy/a/b')), [u'c'], []),
+            (unicode(self.path.join(u'copy/a/b/c')), [], [u'f3']),
+            (unicode(self.path.join(u'copy/a/d')), [], [])])
+        with self.path.join(u'copy/a/f2').open() as f:
+            eq(f.read(), 'x')
+        ## the source is untouched
+        eq(len(list(self.path.child(u'a').walk())), 4)
+
+    def test_mmap(self):
+        p = self._create_file(u'foo', 'hello world')
+        m = p.mmap()
+        with m:
+            eq(len(m), 11)
+            eq(m[:5], 'hello')
+            eq(m[-1], 'd')
+            eq(m[::2], 'hlowrd')
+            assert_raises(TypeError, m.__setitem__, 0, 'H')
+        assert m.closed
+        with p.mmap(offset=6) as m:
+            eq(m[:], 'world')
+        with p.mmap(offset=2, length=3) as m:
+            eq(m[:], 'llo')
+            assert_raises(IndexError, m.__getitem__, 3)
+        with p.mmap('c') as m:
+            m[:5] = 'HELLO'
+            eq(m[:], 'HELLO world')
+        with p.open() as f:
+            eq(f.read(), 'hello world')
+        with p.mmap('w', offset=6) as m:
+            m[:] = 'WORLD'
+            assert_raises(IndexError, m.__setitem__, slice(0, 2), 'x')
+        with p.open() as f:
+            eq(f.read(), 'hello WORLD')
+
+    def test_parallel_walk_ordered(self):
+        self._make_walk_tree()
+        expected = self._walk_names(self.path.walk())
+        eq(len(expected), 6)
+        got = self._walk_names(self.path.parallel_walk(workers=3))
+        eq(got, expected)
+
+    def test_parallel_walk_unordered(self):
+        self._make_walk_tree()
+        expected = sorted(self._walk_names(self.path.walk()))
+        got = self._walk_names(
+            self.path.parallel_walk(workers=3, ordered=False))
+        eq(sorted(got), expected)
+        ## parents come before their children
+        dirs = [x[0] for x in got]
+        for (i, d) in enumerate(dirs):
+            for parent in dirs[i+1:]:
+                assert not d.startswith(parent + u'/'), (d, parent)
+
+    def test_parallel_walk_prune(self):
+        self._make_walk_tree()
+        for ordered in (True, False):
+            got = []
+            for (d, subdirs, nondirs) in self.path.parallel_walk(
+                ordered=ordered):
+                got.append(d)
+                subdirs[:] = [x for x in subdirs if x.name() != u'a']
+            eq(sorted(got), sorted([self.path, self.path.child(u'e')]))
+
+    def test_parallel_walk_insecure(self):
+        self._make_walk_tree()
+        for ordered in (True, False):
+            try:
+                for (d, subdirs, nondirs) in self.path.parallel_walk(
+                    ordered=ordered):
+                    eq(d, self.path)
+                    subdirs[0] = self.path.parent()
+            except filesystem.InsecurePathError:
+                pass
+            else:
+                assert False, 'walk escaped the subtree'
+
 
 class LinkOpMixin(OperationsMixin):
     """
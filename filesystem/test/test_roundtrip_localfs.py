@@ -9,3 +9,17 @@ import filesystem
 class LocalFS_Tests(test_roundtrip.PosixOpMixin):
     def setUp(self):
         self.path = filesystem.path(maketemp())
+
+class cached_path(filesystem.path):
+    stat_cache = filesystem.StatCache()
+
+class LocalFSStatCache_Tests(test_roundtrip.PosixOpMixin):
+    def setUp(self):
+        self.path = cached_path(maketemp())
+
+class dirfd_path(filesystem.path):
+    dirfd_cache = filesystem.DirFDCache(max_fds=4)
+
+class LocalFSDirFD_Tests(test_roundtrip.PosixOpMixin):
+    def setUp(self):
+        self.path = dirfd_path(maketemp())
@@ -0,0 +1,96 @@
+from __future__ import with_statement
+import os
+import time
+
+from nose.tools import eq_ as eq
+
+from filesystem.test.util import (
+    maketemp,
+    assert_raises,
+    )
+
+import filesystem
+import filesystem.inmem
+import filesystem.snapshot
+
+def _inmem():
+    p = filesystem.inmem.path()
+    p.mkdir(create_parents=True, may_exist=True)
+    return p
+
+def _write(p, content):
+    with p.open(u'w') as f:
+        f.write(content)
+
+def _age(p, seconds=3600):
+    t = time.time() - seconds
+    os.utime(p._pathname, (t, t))
+
+def test_take():
+    p = _inmem()
+    p.join(u'a/b').mkdir(create_parents=True)
+    _write(p.join(u'a/foo'), 'bar')
+    snap = filesystem.snapshot.take(p)
+    eq(sorted(snap.entries), [u'', u'a', u'a/b', u'a/foo'])
+    eq(snap.entries[u'a/foo'][:2], ('f', 3))
+    eq(snap.entries[u'a/b'][0], 'd')
+    eq(sorted(snap.children(u'a')), [u'b', u'foo'])
+
+def test_diff():
+    p = _inmem()
+    p.join(u'a/b').mkdir(create_parents=True)
+    _write(p.join(u'a/foo'), 'bar')
+    _write(p.child(u'gone'), 'bar')
+    old = filesystem.snapshot.take(p)
+    _write(p.join(u'a/foo'), 'barfoo')
+    _write(p.join(u'a/b/new'), 'bar')
+    p.child(u'gone').unlink()
+    new = filesystem.snapshot.take(p)
+    changes = filesystem.snapshot.diff(old, new)
+    eq(changes.added, set([u'a/b/new']))
+    eq(changes.removed, set([u'gone']))
+    eq(changes.modified, set([u'a/foo']))
+    assert changes
+    assert not filesystem.snapshot.diff(new, new)
+
+def test_save_load():
+    p = _inmem()
+    p.child(u'd\xe9j\xe0').mkdir()
+    _write(p.join(u'd\xe9j\xe0/foo'), 'bar')
+    snap = filesystem.snapshot.take(p)
+    index = _inmem().child(u'index')
+    snap.save(index)
+    eq(filesystem.snapshot.load(index).entries, snap.entries)
+
+def test_load_garbage():
+    index = _inmem().child(u'index')
+    _write(index, 'garbage')
+    assert_raises(ValueError, filesystem.snapshot.load, index)
+    snap = filesystem.snapshot.Snapshot({u'': ('d', 0, 0, 0), u'a': ('f', 1, 0, 0)})
+    snap.save(index)
+    with index.open(u'rb') as f:
+        data = f.read()
+    _write(index, data[:-3])
+    assert_raises(ValueError, filesystem.snapshot.load, index)
+
+def test_trust_dir_mtimes():
+    tmp = filesystem.path(maketemp())
+    for d in (u'a', u'b'):
+        tmp.join(d + u'/sub').mkdir(create_parents=True)
+        _write(tmp.join(d + u'/sub/foo'), 'bar')
+        _age(tmp.join(d + u'/sub'))
+        _age(tmp.child(d))
+    _age(tmp)
+    old = filesystem.snapshot.take(tmp)
+    ## a new file in a/sub is found, though a and the top didn't change
+    _write(tmp.join(u'a/sub/new'), 'bar')
+    _age(tmp.join(u'a/sub'), 1800)
+    ## b/sub/foo changed in place isn't, as b/sub didn't change
+    _write(tmp.join(u'b/sub/foo'), 'barfoo')
+    new = filesystem.snapshot.take(tmp, previous=old, trust_dir_mtimes=True)
+    changes = filesystem.snapshot.diff(old, new)
+    eq(changes.added, set([u'a/sub/new']))
+    eq(changes.modified, set())
+    new = filesystem.snapshot.take(tmp, previous=old)
+    changes = filesystem.snapshot.diff(old, new)
+    eq(changes.modified, set([u'b/sub/foo']))